@@ -47,6 +47,11 @@ class VerificationCode(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # 按邮箱或手机号校验验证码
+            models.Index(fields=['email', 'code', 'code_type', 'is_used'], name='vcode_email_lookup_idx'),
+            models.Index(fields=['phone', 'code', 'code_type', 'is_used'], name='vcode_phone_lookup_idx'),
+        ]
     
     def is_expired(self):
         return timezone.now() > self.expires_at
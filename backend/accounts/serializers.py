@@ -15,6 +15,13 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         model = User
         fields = ['email', 'phone', 'name', 'password', 'confirm_password', 'verification_code', 'user_type']
     
+    def validate_email(self, value):
+        # 邮箱同时用作 username，长度不能超过 username 的上限
+        max_length = User._meta.get_field('username').max_length
+        if len(value) > max_length:
+            raise serializers.ValidationError(f"邮箱长度不能超过{max_length}个字符")
+        return value
+    
     def validate(self, attrs):
         if attrs['password'] != attrs['confirm_password']:
             raise serializers.ValidationError("两次输入的密码不一致")
@@ -50,7 +57,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         validated_data.pop('confirm_password')
         code = validated_data.pop('verification_code')
         
-        user = User.objects.create_user(**validated_data)
+        # 以邮箱登录，username 只需唯一，直接使用邮箱
+        user = User.objects.create_user(username=validated_data['email'], **validated_data)
         
         # 标记验证码为已使用
         email = validated_data.get('email')
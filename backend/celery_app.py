@@ -12,6 +12,11 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # 自动发现任务
 app.autodiscover_tasks()
 
+# 任务与Web请求使用同样的SQL/耗时统计与栈采样
+from writepro_backend import instrumentation, profiler
+instrumentation.connect_celery_signals()
+profiler.connect_celery_signals()
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
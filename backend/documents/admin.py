@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document, DocumentProcessingLog
+from .models import Document, DocumentProcessingLog, DocumentSegment, RewriteCacheEntry, UploadSession
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
@@ -7,11 +7,31 @@ class DocumentAdmin(admin.ModelAdmin):
     list_filter = ['status', 'file_type', 'rewrite_type']
     search_fields = ['title', 'user__name', 'user__email']
     ordering = ['-created_at']
-    readonly_fields = ['id', 'file_size', 'word_count', 'created_at', 'updated_at']
+    readonly_fields = ['id', 'file_size', 'word_count', 'content_hash', 'extracted_text', 'created_at', 'updated_at']
+
+@admin.register(DocumentSegment)
+class DocumentSegmentAdmin(admin.ModelAdmin):
+    list_display = ['document', 'index', 'status', 'attempts', 'aigc_task_id', 'updated_at']
+    list_filter = ['status']
+    search_fields = ['document__title', 'aigc_task_id']
+    ordering = ['document', 'index']
+
+@admin.register(RewriteCacheEntry)
+class RewriteCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['key', 'size', 'hit_count', 'created_at', 'last_used_at']
+    search_fields = ['key']
+    ordering = ['-last_used_at']
 
 @admin.register(DocumentProcessingLog)
 class DocumentProcessingLogAdmin(admin.ModelAdmin):
     list_display = ['document', 'step', 'status', 'created_at']
     list_filter = ['status', 'step']
     search_fields = ['document__title', 'message']
+    ordering = ['-created_at']
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'user', 'status', 'received_size', 'total_size', 'created_at']
+    list_filter = ['status']
+    search_fields = ['filename', 'user__name', 'user__email']
     ordering = ['-created_at']
\ No newline at end of file
@@ -0,0 +1,194 @@
+import os
+import gzip
+import hmac
+import json
+import time
+import random
+import hashlib
+import requests
+from django.conf import settings
+from django.utils.http import parse_http_date_safe
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .metrics import observe_aigc_request
+
+class AIGCUnavailableError(Exception):
+    """AIGC服务暂时不可用（连接失败、超时或5xx），与请求本身的错误区分"""
+
+class AIGCThrottledError(Exception):
+    """AIGC服务限流（429，或带 Retry-After 的503），retry_after 为建议等待的秒数"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def parse_retry_after(response):
+    """解析 Retry-After 响应头（秒数或HTTP日期），没有或无法解析时返回 None"""
+    value = response.headers.get('Retry-After', '').strip() if response is not None else ''
+    if value.isdigit():
+        return int(value)
+    retry_at = parse_http_date_safe(value) if value else None
+    return max(retry_at - time.time(), 0) if retry_at is not None else None
+
+def is_throttled_response(response):
+    """429，或带 Retry-After 的503，视为服务端限流"""
+    if response is None:
+        return False
+    return response.status_code == 429 or (response.status_code == 503 and 'Retry-After' in response.headers)
+
+class _JitteredRetry(Retry):
+    """指数退避加随机抖动，避免多个工作进程同时重试"""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff else 0
+
+def _iter_submit_body(chunks, options):
+    """逐块生成提交给AIGC服务的JSON请求体，避免拼接完整文本"""
+    yield b'{"text": "'
+    for _, text in chunks:
+        # json.dumps 负责转义，去掉两侧引号后即为字符串内部片段
+        yield json.dumps(text)[1:-1].encode('utf-8')
+    yield b'", ' + json.dumps(options)[1:].encode('utf-8')
+
+def sign_webhook(secret, timestamp, body):
+    """计算回调签名：HMAC-SHA256(secret, "<timestamp>.<body>") 的十六进制摘要"""
+    message = str(timestamp).encode('utf-8') + b'.' + body
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def verify_webhook_signature(secret, timestamp, body, signature, tolerance):
+    """校验回调签名与时间戳，超出容忍时间的请求视为重放"""
+    if not secret or not timestamp or not signature:
+        return False
+    
+    try:
+        if abs(time.time() - int(timestamp)) > tolerance:
+            return False
+    except ValueError:
+        return False
+    
+    return hmac.compare_digest(sign_webhook(secret, timestamp, body), signature)
+
+class AIGCClient:
+    """AIGC服务客户端
+
+    复用同一个 requests.Session，连接池内保持长连接。状态查询与结果下载是幂等的，
+    遇到连接错误或 502/503/504 时按带抖动的指数退避自动重试；提交请求只在连接
+    建立失败时重试，避免重复创建任务。
+    """
+
+    def __init__(self, base_url, connect_timeout=5, read_timeout=30, status_timeout=10,
+                 pool_size=10, max_retries=3, backoff_factor=0.5, gzip_min_bytes=None):
+        self.base_url = base_url.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.status_timeout = status_timeout
+        self.gzip_min_bytes = gzip_min_bytes
+
+        retry = _JitteredRetry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _url(self, path):
+        return f"{self.base_url}{path}"
+
+    def submit(self, text, rewrite_type='standard', language='zh', callback_url=None):
+        """提交改写任务，text 可以是字符串或 (offset, text) 块的迭代器
+
+        提供 callback_url 时，服务端在任务完成或失败后回调该地址。
+        """
+        headers = {'Content-Type': 'application/json'}
+        options = {'rewrite_type': rewrite_type, 'language': language}
+        if callback_url:
+            options['callback_url'] = callback_url
+
+        if isinstance(text, str):
+            body = json.dumps({'text': text, **options}).encode('utf-8')
+
+            if self.gzip_min_bytes is not None and len(body) >= self.gzip_min_bytes:
+                body = gzip.compress(body)
+                headers['Content-Encoding'] = 'gzip'
+        else:
+            body = _iter_submit_body(text, options)
+
+        with observe_aigc_request('submit'):
+            response = self.session.post(
+                self._url('/api/rewrite/submit'),
+                data=body,
+                headers=headers,
+                timeout=(self.connect_timeout, self.read_timeout)
+            )
+            response.raise_for_status()
+            return response.json()
+
+    def status(self, task_id):
+        """查询任务状态"""
+        with observe_aigc_request('status'):
+            response = self.session.get(
+                self._url(f'/api/rewrite/status/{task_id}'),
+                timeout=(self.connect_timeout, self.status_timeout)
+            )
+            response.raise_for_status()
+            return response.json()
+
+    def batch_status(self, task_ids, path):
+        """通过批量接口查询多个任务状态
+        
+        请求体为 {"task_ids": [...]}，响应为 {"tasks": {task_id: 状态字典}}。
+        """
+        with observe_aigc_request('batch_status'):
+            response = self.session.post(
+                self._url(path),
+                json={'task_ids': list(task_ids)},
+                timeout=(self.connect_timeout, self.status_timeout)
+            )
+            response.raise_for_status()
+            return response.json().get('tasks', {})
+
+    def download(self, task_id):
+        """下载任务结果"""
+        with observe_aigc_request('download'):
+            response = self.session.get(
+                self._url(f'/api/rewrite/download/{task_id}'),
+                timeout=(self.connect_timeout, self.read_timeout)
+            )
+            response.raise_for_status()
+            return response.content
+
+    def close(self):
+        self.session.close()
+
+# 每个进程一个客户端；fork 出的子进程不能复用父进程的连接
+_client = None
+_client_pid = None
+
+def get_aigc_client():
+    """获取当前进程复用的AIGC客户端"""
+    global _client, _client_pid
+
+    if _client is None or _client_pid != os.getpid():
+        _client = AIGCClient(
+            settings.AIGC_SERVICE_URL,
+            connect_timeout=settings.AIGC_CONNECT_TIMEOUT,
+            read_timeout=settings.AIGC_READ_TIMEOUT,
+            status_timeout=settings.AIGC_STATUS_TIMEOUT,
+            # 逐个并发查询状态时每个线程都需要一条连接，连接池不小于查询并发数
+            pool_size=max(settings.AIGC_POOL_SIZE, settings.AIGC_POLL_CONCURRENCY),
+            max_retries=settings.AIGC_MAX_RETRIES,
+            backoff_factor=settings.AIGC_RETRY_BACKOFF,
+            gzip_min_bytes=settings.AIGC_GZIP_MIN_BYTES if settings.AIGC_GZIP_REQUESTS else None,
+        )
+        _client_pid = os.getpid()
+    return _client
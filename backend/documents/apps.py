@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class DocumentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'documents'
-    verbose_name = '文档管理'
\ No newline at end of file
+    verbose_name = '文档管理'
+
+    def ready(self):
+        from . import signals  # noqa: F401
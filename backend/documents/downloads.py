@@ -0,0 +1,186 @@
+import os
+import re
+import mimetypes
+from urllib.parse import quote
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+# 流式下载时每次读取的字节数
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def _file_etag(stat):
+    """根据文件大小与修改时间生成ETag"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+def _etag_matches(header, etag):
+    """判断 If-None-Match / If-Range 中是否包含当前ETag"""
+    if header.strip() == '*':
+        return True
+    # 弱比较：忽略 W/ 前缀
+    return etag in (tag.strip().removeprefix('W/') for tag in header.split(','))
+
+def _not_modified(request, etag, mtime):
+    """处理条件请求，资源未变化时返回 True"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+def _parse_range(request, size, etag, mtime):
+    """解析单段 Range 请求头，返回 (start, end)；不适用时返回 None
+
+    无法满足的范围抛出 ValueError。多段范围不支持，按完整文件返回。
+    """
+    range_header = request.headers.get('Range')
+    if not range_header or size == 0:
+        return None
+
+    # If-Range 与当前版本不一致时忽略 Range，返回完整文件
+    if_range = request.headers.get('If-Range')
+    if if_range:
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            if if_range != etag:
+                return None
+        else:
+            if_range_date = parse_http_date_safe(if_range)
+            if if_range_date is None or int(mtime) > if_range_date:
+                return None
+
+    match = _RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # bytes=-N 表示最后N个字节
+        length = int(last)
+        if length == 0:
+            raise ValueError('unsatisfiable range')
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('unsatisfiable range')
+    return start, end
+
+def _iter_file_range(path, start, length):
+    """按块读取文件的指定区间"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            block = f.read(min(DOWNLOAD_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+async def _aiter_file_range(path, start, length):
+    """ASGI下的异步版本：在线程池中逐块读取，边读边发送"""
+    blocks = _iter_file_range(path, start, length)
+    try:
+        while True:
+            block = await sync_to_async(next, thread_sensitive=False)(blocks, None)
+            if block is None:
+                break
+            yield block
+    finally:
+        blocks.close()
+
+def _file_stream(request, path, start, length):
+    """按服务器类型选择文件迭代器
+
+    ASGI下同步迭代器会被整体读入内存后才发送，因此改用异步迭代器。
+    """
+    # DRF 的 Request 包装了原始的 HttpRequest
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        return _aiter_file_range(path, start, length)
+    return _iter_file_range(path, start, length)
+
+def build_file_response(request, file_field, filename):
+    """为存储中的文件构建下载响应
+
+    支持 ETag/Last-Modified 条件请求与单段 Range（206）。
+    配置 DOWNLOAD_ACCEL_REDIRECT_PREFIX 时只返回 X-Accel-Redirect，由nginx完成传输。
+    """
+    path = file_field.path
+    stat = os.stat(path)
+    etag = _file_etag(stat)
+    content_type, _ = mimetypes.guess_type(path)
+    if not content_type:
+        content_type = 'application/octet-stream'
+
+    if settings.DOWNLOAD_ACCEL_REDIRECT_PREFIX:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.DOWNLOAD_ACCEL_REDIRECT_PREFIX + quote(file_field.name)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        return response
+
+    try:
+        byte_range = _parse_range(request, stat.st_size, etag, stat.st_mtime)
+    except ValueError:
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _file_stream(request, path, start, length),
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    else:
+        length = stat.st_size
+        response = StreamingHttpResponse(_file_stream(request, path, 0, length), content_type=content_type)
+
+    response['Content-Length'] = length
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+def serve_document_file(request, document, file_type='processed'):
+    """返回文档原文件或处理后文件的下载响应"""
+    if file_type == 'original':
+        file_field = document.original_file
+        filename_prefix = 'original_'
+    elif file_type == 'processed':
+        if not document.processed_file:
+            return Response({
+                'error': '处理后的文件不存在'
+            }, status=status.HTTP_404_NOT_FOUND)
+        file_field = document.processed_file
+        filename_prefix = 'processed_'
+    else:
+        return Response({
+            'error': '无效的文件类型'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if not file_field or not os.path.exists(file_field.path):
+        raise Http404("文件不存在")
+
+    filename = f"{filename_prefix}{document.title}{document.file_type}"
+    return build_file_response(request, file_field, filename)
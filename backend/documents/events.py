@@ -0,0 +1,113 @@
+import json
+import asyncio
+from collections import defaultdict
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from writepro_backend.redis_client import get_redis
+
+# 文档终态，推送到这些状态后关闭事件流
+TERMINAL_STATUSES = ('completed', 'failed')
+
+def document_channel(document_id):
+    return f'document-events:{document_id}'
+
+def publish_document_event(document_id, event, data):
+    """向文档频道发布事件；发布失败只记录，不影响处理流程"""
+    message = json.dumps({'event': event, 'data': data}, default=str)
+    try:
+        get_redis().publish(document_channel(document_id), message)
+    except redis.RedisError as e:
+        print(f"发布文档事件失败: {str(e)}")
+
+class DocumentEventHub:
+    """进程内的事件分发中心
+
+    每个ASGI工作进程只保持一个Redis订阅连接，收到的事件分发给本进程内
+    订阅了对应文档的事件流，空闲连接只占用一个 asyncio.Queue。
+    """
+
+    QUEUE_SIZE = 100
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.listener = None
+
+    def subscribe(self, document_id):
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self._listen())
+
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self.subscribers[str(document_id)].add(queue)
+        return queue
+
+    def unsubscribe(self, document_id, queue):
+        queues = self.subscribers.get(str(document_id))
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[str(document_id)]
+
+    def _dispatch(self, channel, data):
+        document_id = channel.split(':', 1)[1]
+        for queue in self.subscribers.get(document_id, ()):
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                # 客户端消费过慢时丢弃事件，之后的状态事件会带上最新进度
+                pass
+
+    async def _listen(self):
+        while True:
+            client = aioredis.Redis.from_url(settings.REDIS_URL)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(document_channel('*'))
+                async for message in pubsub.listen():
+                    if message['type'] == 'pmessage':
+                        self._dispatch(message['channel'].decode(), json.loads(message['data']))
+            except redis.RedisError as e:
+                print(f"订阅文档事件失败，稍后重连: {str(e)}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+event_hub = DocumentEventHub()
+
+def format_sse(event, data):
+    """按 text/event-stream 格式编码一条事件"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str, ensure_ascii=False)}\n\n"
+
+async def iter_document_events(document_id, snapshot):
+    """生成文档的SSE事件流：先发送当前状态快照，再转发实时事件，到达终态后结束
+
+    snapshot 为返回当前状态字典的异步函数；先订阅再取快照，避免两者之间的事件丢失。
+    Django 4.2 在发送流式响应期间不处理客户端断开，断开后生成器会一直运行，
+    因此发送 SSE_MAX_HEARTBEATS 次心跳后主动结束，EventSource 按 retry 间隔自动重连并重新取快照。
+    """
+    queue = event_hub.subscribe(document_id)
+    try:
+        yield f'retry: {settings.SSE_RETRY_MS}\n\n'
+        current = await snapshot()
+        yield format_sse('status', current)
+        if current['status'] in TERMINAL_STATUSES:
+            return
+
+        heartbeats = 0
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=settings.SSE_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if heartbeats >= settings.SSE_MAX_HEARTBEATS:
+                    return
+                heartbeats += 1
+                # 注释行作为心跳，防止代理关闭空闲连接
+                yield ': keepalive\n\n'
+                continue
+
+            yield format_sse(message['event'], message['data'])
+            if message['event'] == 'status' and message['data']['status'] in TERMINAL_STATUSES:
+                return
+    finally:
+        event_hub.unsubscribe(document_id, queue)
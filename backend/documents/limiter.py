@@ -0,0 +1,158 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+class AdaptiveLimiter:
+    """所有工作进程共享的AIGC提交并发上限（AIMD）
+
+    提交成功且耗时低于目标时上限缓慢增加（每个完整窗口约加1），
+    出错或超过目标耗时时上限减半；减半在一个目标耗时内最多发生一次，
+    避免同一批慢请求把上限压到最低。状态保存在共享缓存（Redis）中。
+    """
+
+    LIMIT_KEY = 'aigc-limiter:limit'
+    SLOT_KEY_PREFIX = 'aigc-limiter:slot:'
+    DECREASED_AT_KEY = 'aigc-limiter:decreased-at'
+    PAUSED_KEY = 'aigc-limiter:paused'
+
+    def _lease_timeout(self):
+        # 每个名额单独过期：工作进程异常退出时未归还的名额在一次请求的最长耗时后自动释放
+        return int(settings.AIGC_CONNECT_TIMEOUT + settings.AIGC_READ_TIMEOUT) * 2
+
+    def _slot_keys(self):
+        return [f'{self.SLOT_KEY_PREFIX}{index}' for index in range(settings.AIGC_LIMIT_MAX)]
+
+    def limit(self):
+        return cache.get(self.LIMIT_KEY, float(settings.AIGC_LIMIT_INITIAL))
+
+    def in_flight(self):
+        return len(cache.get_many(self._slot_keys()))
+
+    def pause(self, retry_after=None):
+        """服务端限流后暂停所有进程的提交，retry_after 为空时使用默认等待时间"""
+        delay = settings.AIGC_THROTTLE_DEFAULT_DELAY if retry_after is None else retry_after
+        delay = min(delay, settings.AIGC_THROTTLE_MAX_DELAY)
+        if delay > 0:
+            cache.set(self.PAUSED_KEY, time.time() + delay, max(int(delay), 1))
+
+    def paused(self):
+        paused_until = cache.get(self.PAUSED_KEY)
+        return paused_until is not None and paused_until > time.time()
+
+    def acquire(self):
+        """占用一个提交名额，返回名额的键；已达上限或限流暂停期间返回 None"""
+        if self.paused():
+            return None
+
+        limit = int(self.limit())
+        slot_keys = self._slot_keys()
+        held = cache.get_many(slot_keys)
+        # 上限刚减小时编号更大的名额可能仍被占用，也计入在途数
+        if len(held) >= limit:
+            return None
+
+        for key in slot_keys[:limit]:
+            if key not in held and cache.add(key, time.time(), self._lease_timeout()):
+                return key
+        return None
+
+    def release(self, lease, latency, ok):
+        """归还名额，并根据本次耗时与结果调整上限"""
+        cache.delete(lease)
+
+        limit = self.limit()
+        if ok and latency <= settings.AIGC_LATENCY_TARGET:
+            limit = min(limit + 1 / limit, float(settings.AIGC_LIMIT_MAX))
+        elif cache.add(self.DECREASED_AT_KEY, time.time(), max(int(settings.AIGC_LATENCY_TARGET), 1)):
+            limit = max(limit * settings.AIGC_LIMIT_DECREASE_FACTOR, float(settings.AIGC_LIMIT_MIN))
+        else:
+            return
+        cache.set(self.LIMIT_KEY, limit, None)
+
+class CircuitBreaker:
+    """AIGC服务熔断器
+
+    统计窗口内连续出现足够多的服务不可用错误后打开，冷却期内不再提交；
+    冷却结束后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    FAILURES_KEY = 'aigc-breaker:failures'
+    OPENED_AT_KEY = 'aigc-breaker:opened-at'
+    PROBE_KEY = 'aigc-breaker:probe'
+
+    def state(self):
+        opened_at = cache.get(self.OPENED_AT_KEY)
+        if opened_at is None:
+            return 'closed'
+        if time.time() - opened_at < settings.AIGC_BREAKER_COOLDOWN:
+            return 'open'
+        return 'half_open'
+
+    def failures(self):
+        return cache.get(self.FAILURES_KEY, 0)
+
+    def allow(self):
+        """是否允许发起一次提交"""
+        state = self.state()
+        if state == 'closed':
+            return True
+        if state == 'open':
+            return False
+        # 半开状态下只有拿到探测名额的请求可以通过
+        return cache.add(self.PROBE_KEY, True, int(settings.AIGC_CONNECT_TIMEOUT + settings.AIGC_READ_TIMEOUT))
+
+    def release_probe(self):
+        """归还未使用的探测名额"""
+        cache.delete(self.PROBE_KEY)
+
+    def record_success(self):
+        if cache.get(self.OPENED_AT_KEY) is not None:
+            cache.delete_many([self.OPENED_AT_KEY, self.PROBE_KEY])
+        cache.delete(self.FAILURES_KEY)
+
+    def record_failure(self):
+        if self.state() == 'half_open':
+            # 探测失败，重新开始冷却
+            cache.set(self.OPENED_AT_KEY, time.time(), None)
+            cache.delete(self.PROBE_KEY)
+            return
+
+        cache.add(self.FAILURES_KEY, 0, settings.AIGC_BREAKER_WINDOW)
+        if cache.incr(self.FAILURES_KEY) >= settings.AIGC_BREAKER_FAILURE_THRESHOLD:
+            cache.add(self.OPENED_AT_KEY, time.time(), None)
+
+aigc_limiter = AdaptiveLimiter()
+aigc_breaker = CircuitBreaker()
+
+def acquire_submission_slot():
+    """熔断器允许且未超过并发上限时占用一个提交名额，返回名额（用于归还）；不允许时返回 None"""
+    if not aigc_breaker.allow():
+        return None
+
+    lease = aigc_limiter.acquire()
+    if lease is None and aigc_breaker.state() == 'half_open':
+        # 拿到了探测名额却没有并发名额，不归还的话在探测名额过期前没有请求能够探测
+        aigc_breaker.release_probe()
+    return lease
+
+def release_submission_slot(lease, latency, healthy, throttled=False):
+    """归还提交名额，并把本次结果反馈给限流器与熔断器
+
+    被限流时并发上限减半，但服务仍在线，不计入熔断失败，也不视为探测成功。
+    """
+    aigc_limiter.release(lease, latency, healthy and not throttled)
+    if throttled:
+        aigc_breaker.release_probe()
+    elif healthy:
+        aigc_breaker.record_success()
+    else:
+        aigc_breaker.record_failure()
+
+def aigc_health_metrics():
+    """当前限流与熔断状态"""
+    return {
+        'concurrency_limit': round(aigc_limiter.limit(), 2),
+        'in_flight': aigc_limiter.in_flight(),
+        'breaker_state': aigc_breaker.state(),
+        'breaker_failures': aigc_breaker.failures(),
+    }
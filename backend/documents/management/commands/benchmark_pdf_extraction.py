@@ -0,0 +1,69 @@
+import os
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import PyPDF2
+from documents.utils import iter_text_chunks
+
+class Command(BaseCommand):
+    help = '对比PDF串行与并行文本提取在不同页数下的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pdf_path', help='作为页面来源的PDF文件，页数不足时循环复制')
+        parser.add_argument(
+            '--pages', default='10,50,100,200,400',
+            help='逗号分隔的测试页数，默认 10,50,100,200,400'
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='每组重复次数，取最短耗时')
+
+    def handle(self, *args, **options):
+        source_path = options['pdf_path']
+        if not os.path.exists(source_path):
+            raise CommandError(f'文件不存在: {source_path}')
+
+        try:
+            page_counts = [int(p) for p in options['pages'].split(',') if p.strip()]
+        except ValueError:
+            raise CommandError('--pages 必须是逗号分隔的整数')
+
+        self.stdout.write(
+            f'进程数: {settings.PDF_EXTRACT_WORKERS}，'
+            f'每个任务页数: {settings.PDF_PAGES_PER_TASK}，'
+            f'并行阈值: {settings.PDF_PARALLEL_MIN_PAGES}页'
+        )
+        self.stdout.write(f'{"页数":>6} {"串行(s)":>10} {"并行(s)":>10} {"加速比":>8}')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for page_count in page_counts:
+                pdf_path = os.path.join(tmp_dir, f'bench_{page_count}.pdf')
+                self._build_pdf(source_path, pdf_path, page_count)
+
+                # 预热进程池，避免把创建子进程的开销算进第一组
+                self._time_extraction(pdf_path, parallel=True)
+
+                serial = min(self._time_extraction(pdf_path, parallel=False) for _ in range(options['repeat']))
+                parallel = min(self._time_extraction(pdf_path, parallel=True) for _ in range(options['repeat']))
+
+                self.stdout.write(f'{page_count:>6} {serial:>10.3f} {parallel:>10.3f} {serial / parallel:>7.2f}x')
+
+    def _build_pdf(self, source_path, target_path, page_count):
+        """循环复制来源PDF的页面，生成指定页数的测试文件"""
+        reader = PyPDF2.PdfReader(source_path)
+        writer = PyPDF2.PdfWriter()
+        source_pages = len(reader.pages)
+
+        if source_pages == 0:
+            raise CommandError('来源PDF没有页面')
+
+        for i in range(page_count):
+            writer.add_page(reader.pages[i % source_pages])
+
+        with open(target_path, 'wb') as f:
+            writer.write(f)
+
+    def _time_extraction(self, pdf_path, parallel):
+        start = time.perf_counter()
+        for _ in iter_text_chunks(pdf_path, parallel=parallel):
+            pass
+        return time.perf_counter() - start
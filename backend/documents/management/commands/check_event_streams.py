@@ -0,0 +1,70 @@
+import asyncio
+from unittest import mock
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from documents import events
+
+DOCUMENT_ID = '00000000-0000-0000-0000-000000000001'
+
+class _LocalHub(events.DocumentEventHub):
+    """不连接Redis的事件中心，由检查代码直接分发事件"""
+
+    async def _listen(self):
+        await asyncio.Event().wait()
+
+async def _snapshot_processing():
+    return {'status': 'processing', 'progress': 50}
+
+class Command(BaseCommand):
+    help = '检查文档事件流在各种结束方式下都会释放订阅（不需要Redis）'
+
+    def handle(self, *args, **options):
+        failures = asyncio.run(self._run())
+        if failures:
+            raise CommandError(f"{len(failures)}项检查未通过: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('事件流均已释放订阅'))
+
+    async def _run(self):
+        failures = []
+        checks = [
+            ('heartbeat_limit', self._heartbeat_limit),
+            ('terminal_status', self._terminal_status),
+            ('client_close', self._client_close),
+        ]
+        for name, check in checks:
+            hub = _LocalHub()
+            with mock.patch.object(events, 'event_hub', hub), \
+                    override_settings(SSE_HEARTBEAT_INTERVAL=0.01, SSE_MAX_HEARTBEATS=3):
+                try:
+                    chunks = await asyncio.wait_for(check(hub), timeout=5)
+                except asyncio.TimeoutError:
+                    chunks, error = None, '事件流未结束'
+                else:
+                    error = None if not hub.subscribers else f'订阅未释放: {dict(hub.subscribers)}'
+                if hub.listener is not None:
+                    hub.listener.cancel()
+
+            status = self.style.ERROR(error) if error else self.style.SUCCESS('OK')
+            self.stdout.write(f'{name:<20} {status}')
+            if chunks is not None:
+                self.stdout.write(f'    {chunks!r}')
+            if error:
+                failures.append(name)
+        return failures
+
+    async def _heartbeat_limit(self, hub):
+        # 文档一直不到终态、客户端已断开：发送有限次心跳后结束
+        return [chunk async for chunk in events.iter_document_events(DOCUMENT_ID, _snapshot_processing)]
+
+    async def _terminal_status(self, hub):
+        stream = events.iter_document_events(DOCUMENT_ID, _snapshot_processing)
+        chunks = [await stream.__anext__(), await stream.__anext__()]
+        hub._dispatch(events.document_channel(DOCUMENT_ID), {'event': 'status', 'data': {'status': 'completed'}})
+        chunks.extend([chunk async for chunk in stream])
+        return chunks
+
+    async def _client_close(self, hub):
+        stream = events.iter_document_events(DOCUMENT_ID, _snapshot_processing)
+        chunks = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        return chunks
@@ -0,0 +1,322 @@
+import time
+import json
+import shutil
+import hashlib
+import tempfile
+from decimal import Decimal
+from datetime import timedelta
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from accounts.models import User, VerificationCode
+from documents import utils as document_utils
+from documents.aigc import sign_webhook
+from documents.models import Document, DocumentSegment
+from orders.models import Order
+from payments.models import RechargePackage
+
+# 每个接口允许的最大查询次数（含Token认证查询）。
+# 列表类接口的种子数据有多条记录，出现N+1时查询次数会随记录数增长而超出预算。
+QUERY_BUDGETS = {
+    'send_code': 1,
+    'register': 9,
+    'login': 5,
+    'user_info': 1,
+    'update_profile': 6,
+    'wechat_qrcode': 0,
+    'upload_document': 3,
+    'create_upload_session': 2,
+    'upload_session_detail': 2,
+    'upload_chunk': 6,
+    'finalize_upload': 7,
+    'document_list': 2,
+    'bulk_document_status': 2,
+    'document_detail': 3,
+    'document_status': 3,
+    'download_document': 2,
+    'aigc_callback': 2,
+    'aigc_metrics': 1,
+    'poll_aigc_tasks': 11,
+    'create_order': 8,
+    'order_list': 4,
+    'order_detail': 4,
+    'pay_order': 8,
+    'cancel_order': 6,
+    'download_order_result': 2,
+    'package_list': 2,
+    'create_recharge_order': 7,
+    'mock_payment_success': 8,
+    'payment_status': 3,
+    'cancel_payment': 6,
+    'recharge_history': 3,
+    'user_credits': 2,
+    'delete_document': 7,
+    'logout': 2,
+}
+
+# 列表类接口的种子记录数
+SEED_ROWS = 5
+
+# 轮询任务按结果分组批量写回，两种批量大小的查询次数应相同
+POLL_BATCH_SIZES = (3, 30)
+
+class Command(BaseCommand):
+    help = '逐个调用 accounts/documents/orders/payments 的接口并统计SQL查询次数，超出预算时返回失败（数据最后回滚）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-queries', action='store_true', help='打印超出预算接口的全部SQL')
+
+    def handle(self, *args, **options):
+        self.verbose = options['verbose_queries']
+        self.results = []
+        media_root = tempfile.mkdtemp(prefix='query-budget-')
+
+        # 只统计数据库查询：缓存与邮件改用本地实现，Celery任务不实际投递，
+        # 文档事件发布不连接Redis
+        overrides = override_settings(
+            MEDIA_ROOT=media_root,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            AIGC_WEBHOOK_SECRET='query-budget',
+            AIGC_CALLBACK_URL='',
+        )
+        try:
+            with overrides, transaction.atomic(), \
+                    mock.patch.object(document_utils.extract_document_text, 'delay'), \
+                    mock.patch.object(document_utils.process_document_with_aigc, 'delay'), \
+                    mock.patch.object(document_utils.advance_document, 'delay'), \
+                    mock.patch('documents.utils.publish_document_event'), \
+                    mock.patch('documents.signals.publish_document_event'):
+                self._run()
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        failures = []
+        self.stdout.write(f'{"接口":<24} {"查询":>4} {"预算":>4}')
+        for name, count, budget, error in self.results:
+            if error:
+                line = self.style.ERROR(f'{name:<24} {error}')
+                failures.append(name)
+            elif count > budget:
+                line = self.style.ERROR(f'{name:<24} {count:>4} {budget:>4}  超出预算')
+                failures.append(name)
+            else:
+                line = f'{name:<24} {count:>4} {budget:>4}'
+            self.stdout.write(line)
+
+        missing = set(QUERY_BUDGETS) - {name for name, *_ in self.results}
+        if missing:
+            failures.extend(sorted(missing))
+            self.stdout.write(self.style.ERROR(f"未检查的接口: {', '.join(sorted(missing))}"))
+
+        if failures:
+            raise CommandError(f"{len(failures)}个接口未通过查询预算检查: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('所有接口均在查询预算内'))
+
+    def _call(self, name, client, method, path, expected_status, **kwargs):
+        """调用接口并记录查询次数"""
+        if name not in QUERY_BUDGETS:
+            raise CommandError(f'接口 {name} 没有设置查询预算')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(path, **kwargs)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+
+        error = None
+        if response.status_code != expected_status:
+            error = f'状态码 {response.status_code}，期望 {expected_status}'
+        elif len(queries) > QUERY_BUDGETS[name] and self.verbose:
+            for query in queries.captured_queries:
+                self.stdout.write(f"    {query['sql']}")
+
+        self.results.append((name, len(queries), QUERY_BUDGETS[name], error))
+        return response
+
+    def _poll_batch(self, document, size):
+        """准备一批到期的已提交分段（完成/失败/处理中各占一部分），返回一次轮询的查询次数"""
+        start = document.segments.count()
+        past = timezone.now() - timedelta(seconds=1)
+        DocumentSegment.objects.bulk_create([
+            DocumentSegment(
+                document=document, index=start + i, source_offset=i, source_text='hello',
+                status='submitted', aigc_task_id=f'budget-poll-{size}-{i}', attempts=1,
+                submitted_at=timezone.now(), next_check_at=past
+            )
+            for i in range(size)
+        ])
+        outcomes = [
+            {'status': 'completed', 'ai_detection_rate': 0.1},
+            {'status': 'failed', 'message': 'budget'},
+            {'status': 'processing'},
+        ]
+        statuses = lambda task_ids: {task_id: outcomes[i % 3] for i, task_id in enumerate(task_ids)}
+
+        with mock.patch.object(document_utils, '_fetch_task_statuses', side_effect=statuses), \
+                CaptureQueriesContext(connection) as queries:
+            document_utils.poll_aigc_tasks()
+        return queries
+
+    def _check_poll_batches(self, document):
+        """轮询写回的查询次数不随批量大小增长"""
+        batches = [self._poll_batch(document, size) for size in POLL_BATCH_SIZES]
+        counts = [len(queries) for queries in batches]
+        error = None
+        if len(set(counts)) > 1:
+            error = '查询次数随批量增长: ' + ', '.join(
+                f'{size}段 {count}次' for size, count in zip(POLL_BATCH_SIZES, counts)
+            )
+        elif counts[-1] > QUERY_BUDGETS['poll_aigc_tasks'] and self.verbose:
+            for query in batches[-1].captured_queries:
+                self.stdout.write(f"    {query['sql']}")
+        self.results.append(('poll_aigc_tasks', counts[-1], QUERY_BUDGETS['poll_aigc_tasks'], error))
+
+    def _client(self, user=None):
+        client = APIClient()
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def _seed(self, user):
+        """为列表类接口准备多条记录"""
+        package = RechargePackage.objects.create(name='预算测试套餐', amount=Decimal('10.00'), credits=100)
+        for i in range(SEED_ROWS):
+            RechargePackage.objects.create(name=f'套餐{i}', amount=Decimal('20.00'), credits=200)
+
+        documents = []
+        for i in range(SEED_ROWS):
+            document = Document(
+                user=user, title=f'文档{i}', file_type='.txt', file_size=5,
+                word_count=1, status='completed'
+            )
+            document.original_file.save(f'seed{i}.txt', ContentFile(b'hello'), save=False)
+            document.processed_file.save(f'seed{i}.txt', ContentFile(b'HELLO'), save=False)
+            document.save()
+            documents.append(document)
+
+        client = self._client(user)
+        for document in documents:
+            response = client.post('/api/v1/orders/', {'document_id': str(document.id)}, format='json')
+            Order.objects.filter(order_number=response.data['order_number']).update(status='completed')
+
+            response = client.post(
+                '/api/v1/payments/api/payments/create_recharge_order/',
+                {'package_id': package.id, 'payment_method': 'mock'}, format='json'
+            )
+            client.post(f"/api/v1/payments/api/payments/{response.data['payment_id']}/mock_payment_success/")
+
+        return package, documents
+
+    def _run(self):
+        anonymous = self._client()
+        email = f'budget-{int(time.time())}@example.com'
+
+        # accounts
+        self._call('send_code', anonymous, 'post', '/api/v1/auth/send-code/',
+                   200, data={'email': email, 'code_type': 'email_register'}, format='json')
+        code = VerificationCode.objects.filter(email=email).latest('created_at').code
+        self._call('register', anonymous, 'post', '/api/v1/auth/register/', 201, data={
+            'email': email, 'name': 'budget', 'password': 'Budget-Pass-123',
+            'confirm_password': 'Budget-Pass-123', 'verification_code': code,
+        }, format='json')
+        self._call('login', anonymous, 'post', '/api/v1/auth/login/', 200, data={
+            'email': email, 'password': 'Budget-Pass-123', 'login_type': 'email',
+        }, format='json')
+
+        user = User.objects.get(email=email)
+        user.credits = 100000
+        user.is_staff = True
+        user.save()
+        client = self._client(user)
+
+        self._call('user_info', client, 'get', '/api/v1/auth/user-info/', 200)
+        self._call('update_profile', client, 'put', '/api/v1/auth/profile/', 200,
+                   data={'company_name': 'budget'}, format='json')
+        self._call('wechat_qrcode', anonymous, 'get', '/api/v1/auth/wechat/qrcode/', 200)
+
+        package, documents = self._seed(user)
+
+        # documents
+        upload = ContentFile(b'hello world', name='budget.txt')
+        response = self._call('upload_document', client, 'post', '/api/v1/documents/upload/', 201,
+                              data={'title': 'budget', 'file': upload}, format='multipart')
+        uploaded = Document.objects.get(id=response.data['document_id'])
+
+        content = b'chunked upload body'
+        response = self._call('create_upload_session', client, 'post', '/api/v1/documents/uploads/', 201, data={
+            'filename': 'chunked.txt', 'total_size': len(content),
+            'checksum': hashlib.sha256(content).hexdigest(),
+        }, format='json')
+        upload_id = response.data['upload_id']
+        self._call('upload_session_detail', client, 'get', f'/api/v1/documents/uploads/{upload_id}/', 200)
+        self._call('upload_chunk', client, 'put', f'/api/v1/documents/uploads/{upload_id}/chunk/', 200,
+                   data=content, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0',
+                   HTTP_X_CHUNK_SHA256=hashlib.sha256(content).hexdigest())
+        self._call('finalize_upload', client, 'post', f'/api/v1/documents/uploads/{upload_id}/finalize/', 201)
+
+        self._call('document_list', client, 'get', '/api/v1/documents/list/', 200)
+        self._call('bulk_document_status', client, 'get', '/api/v1/documents/status/?ids=' + ','.join(
+            str(document.id) for document in documents
+        ), 200)
+        self._call('document_detail', client, 'get', f'/api/v1/documents/{documents[0].id}/', 200)
+        self._call('document_status', client, 'get', f'/api/v1/documents/{documents[0].id}/status/', 200)
+        self._call('download_document', client, 'get', f'/api/v1/documents/{documents[0].id}/download/', 200)
+
+        uploaded.status = 'processing'
+        uploaded.save()
+        DocumentSegment.objects.create(
+            document=uploaded, index=0, source_offset=0, source_text='hello world',
+            status='submitted', aigc_task_id='budget-task'
+        )
+        body = json.dumps({'task_id': 'budget-task', 'status': 'completed'}).encode('utf-8')
+        timestamp = str(int(time.time()))
+        self._call('aigc_callback', anonymous, 'post', '/api/v1/documents/aigc/callback/', 200,
+                   data=body, content_type='application/json', HTTP_X_AIGC_TIMESTAMP=timestamp,
+                   HTTP_X_AIGC_SIGNATURE=sign_webhook('query-budget', timestamp, body))
+        self._call('aigc_metrics', client, 'get', '/api/v1/documents/aigc/metrics/', 200)
+        self._check_poll_batches(uploaded)
+
+        # orders
+        fresh = Document.objects.create(
+            user=user, title='新订单', original_file=documents[0].original_file.name,
+            file_type='.txt', file_size=5, word_count=1, status='uploaded'
+        )
+        response = self._call('create_order', client, 'post', '/api/v1/orders/', 201,
+                              data={'document_id': str(fresh.id), 'credits_used': 10}, format='json')
+        order_number = response.data['order_number']
+        completed_order = Order.objects.filter(user=user, status='completed').first().order_number
+
+        self._call('order_list', client, 'get', '/api/v1/orders/list/', 200)
+        self._call('order_detail', client, 'get', f'/api/v1/orders/{order_number}/', 200)
+        self._call('pay_order', client, 'post', f'/api/v1/orders/{order_number}/pay/', 200)
+        Order.objects.filter(order_number=order_number).update(status='paid')
+        self._call('cancel_order', client, 'post', f'/api/v1/orders/{order_number}/cancel/', 200)
+        self._call('download_order_result', client, 'get', f'/api/v1/orders/{completed_order}/download/', 200)
+
+        # payments
+        self._call('package_list', client, 'get', '/api/v1/payments/api/packages/', 200)
+        response = self._call('create_recharge_order', client, 'post',
+                              '/api/v1/payments/api/payments/create_recharge_order/', 201,
+                              data={'package_id': package.id, 'payment_method': 'mock'}, format='json')
+        payment_id = response.data['payment_id']
+        self._call('mock_payment_success', client, 'post',
+                   f'/api/v1/payments/api/payments/{payment_id}/mock_payment_success/', 200)
+        self._call('payment_status', client, 'get', f'/api/v1/payments/api/payments/{payment_id}/status/', 200)
+
+        response = client.post('/api/v1/payments/api/payments/create_recharge_order/',
+                               {'package_id': package.id, 'payment_method': 'mock'}, format='json')
+        self._call('cancel_payment', client, 'post',
+                   f"/api/v1/payments/api/payments/{response.data['payment_id']}/cancel/", 200)
+        self._call('recharge_history', client, 'get', '/api/v1/payments/api/recharges/', 200)
+        self._call('user_credits', client, 'get', '/api/v1/payments/api/credits/', 200)
+
+        # 破坏性操作放在最后
+        self._call('delete_document', client, 'delete', f'/api/v1/documents/{uploaded.id}/delete/', 200)
+        self._call('logout', client, 'post', '/api/v1/auth/logout/', 200)
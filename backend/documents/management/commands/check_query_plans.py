@@ -0,0 +1,146 @@
+import re
+import uuid
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from accounts.models import User, VerificationCode
+from documents.models import Document
+from orders.models import Order
+from payments.models import Payment, RechargePackage, RechargeRecord
+from writepro_backend.pagination import KeysetPagination
+
+# SQLite: "SCAN 表名" 且未使用索引即为全表扫描；PostgreSQL: "Seq Scan on 表名"
+_SQLITE_SCAN_RE = re.compile(r'\bSCAN (\w+)\b(?! USING (?:COVERING )?INDEX| USING INTEGER PRIMARY KEY)')
+_POSTGRES_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+
+class Command(BaseCommand):
+    help = '在事务中写入大量测试数据，对热点查询执行 EXPLAIN，出现全表扫描时返回失败（数据最后回滚）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='每张表写入的行数')
+        parser.add_argument('--users', type=int, default=200, help='测试用户数')
+        parser.add_argument('--verbose-plans', action='store_true', help='打印每个查询的完整执行计划')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'不支持的数据库: {connection.vendor}')
+
+        failures = []
+        with transaction.atomic():
+            self.stdout.write(f"写入测试数据: {options['users']}个用户，每表{options['rows']}行...")
+            fixtures = self._seed(options['users'], options['rows'])
+            self._analyze()
+
+            for name, queryset in self._hot_queries(fixtures):
+                plan = queryset.explain()
+                scanned = self._full_scans(plan)
+                status = self.style.ERROR('全表扫描: ' + ', '.join(scanned)) if scanned else self.style.SUCCESS('OK')
+                self.stdout.write(f'{name:<32} {status}')
+                if options['verbose_plans'] or scanned:
+                    self.stdout.write(plan)
+                if scanned:
+                    failures.append(name)
+
+            # 测试数据不保留
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{len(failures)}个查询出现全表扫描: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('所有热点查询均使用索引'))
+
+    def _full_scans(self, plan):
+        pattern = _SQLITE_SCAN_RE if connection.vendor == 'sqlite' else _POSTGRES_SCAN_RE
+        return sorted(set(pattern.findall(plan)))
+
+    def _analyze(self):
+        """更新统计信息，让查询规划器基于真实数据量选择执行计划"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+            else:
+                for model in (User, VerificationCode, Document, Order, Payment, RechargeRecord):
+                    cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+    def _seed(self, user_count, rows):
+        now = timezone.now()
+        run = uuid.uuid4().hex[:8]
+
+        users = User.objects.bulk_create([
+            User(
+                username=f'plan-{run}-{i}', email=f'plan-{run}-{i}@example.com',
+                phone=f'9{run[:4]}{i:06d}', name=f'plan{i}', password='!'
+            )
+            for i in range(user_count)
+        ])
+
+        documents = Document.objects.bulk_create([
+            Document(
+                user=users[i % user_count], title=f'doc{i}', original_file=f'documents/original/plan{i}.txt',
+                file_type='.txt', file_size=1024, status=random.choice(['uploaded', 'processing', 'completed'])
+            )
+            for i in range(rows)
+        ], batch_size=1000)
+
+        Order.objects.bulk_create([
+            Order(
+                order_number=f'PL{run}{i:08d}', user=documents[i].user, document=documents[i],
+                status=random.choice(['pending', 'completed', 'cancelled']),
+                total_amount=Decimal('10.00')
+            )
+            for i in range(rows)
+        ], batch_size=1000)
+
+        package = RechargePackage.objects.create(name=f'plan-{run}', amount=Decimal('10.00'), credits=100)
+        payments = Payment.objects.bulk_create([
+            Payment(
+                user=users[i % user_count], package=package, payment_method='mock',
+                amount=Decimal('10.00'), transaction_id=f'PLAN{run}{i:08d}'
+            )
+            for i in range(rows)
+        ], batch_size=1000)
+        RechargeRecord.objects.bulk_create([
+            RechargeRecord(
+                user=payment.user, payment=payment, amount=payment.amount,
+                credits_received=100
+            )
+            for payment in payments
+        ], batch_size=1000)
+
+        VerificationCode.objects.bulk_create([
+            VerificationCode(
+                email=users[i % user_count].email if i % 2 else None,
+                phone=None if i % 2 else users[i % user_count].phone,
+                code=f'{random.randint(0, 999999):06d}',
+                code_type='email_register' if i % 2 else 'phone_register',
+                is_used=random.random() < 0.8,
+                expires_at=now + timedelta(minutes=10)
+            )
+            for i in range(rows)
+        ], batch_size=1000)
+
+        return {'user': users[0], 'document': documents[0]}
+
+    def _hot_queries(self, fixtures):
+        user = fixtures['user']
+        document = fixtures['document']
+        # 与 document_list 视图相同的游标分页查询，游标取第二页的起点
+        paginator = KeysetPagination()
+        documents = Document.objects.filter(user=user)
+        cursor = list(documents.order_by('-created_at', '-id').values_list('created_at', 'id')[:20])[-1]
+
+        return [
+            ('document_list', Document.objects.filter(user=user).order_by('-created_at', '-id')[:20]),
+            ('document_list (keyset)', paginator.page_queryset(documents, cursor, 20)),
+            ('order_list', Order.objects.filter(user=user).order_by('-created_at', '-id')[:10]),
+            ('order_open_for_document', Order.objects.filter(document=document, status__in=['pending', 'paid', 'processing'])),
+            ('recharge_history', RechargeRecord.objects.filter(user=user).order_by('-created_at', '-id')[:20]),
+            ('verification_code_email', VerificationCode.objects.filter(
+                email=user.email, code='123456', code_type='email_register', is_used=False
+            )),
+            ('verification_code_phone', VerificationCode.objects.filter(
+                phone=user.phone, code='123456', code_type='phone_register', is_used=False
+            )),
+        ]
@@ -0,0 +1,20 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from writepro_backend.profiler import PROFILE_HEADER, sign_profile_request
+
+class Command(BaseCommand):
+    help = '生成对单个请求做栈采样的 X-Profile-Signature 请求头'
+
+    def add_arguments(self, parser):
+        parser.add_argument('method', help='请求方法，如 GET')
+        parser.add_argument('path', help='请求路径（不含查询参数），如 /api/v1/documents/list/')
+
+    def handle(self, *args, **options):
+        if not settings.PROFILER_SECRET:
+            raise CommandError('未配置 PROFILER_SECRET')
+
+        timestamp = str(int(time.time()))
+        signature = sign_profile_request(settings.PROFILER_SECRET, timestamp, options['method'], options['path'])
+        self.stdout.write(f'{PROFILE_HEADER}: {timestamp}.{signature}')
+        self.stdout.write(f'有效期 {settings.PROFILER_SIGNATURE_TOLERANCE} 秒，采样结果文件名见响应头 X-Profile-Id')
@@ -0,0 +1,292 @@
+import gzip
+import heapq
+import json
+import random
+import re
+import signal
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from documents.aigc import sign_webhook
+
+# 慢速下载时每次写出的字节数
+SIMULATOR_WRITE_BLOCK_SIZE = 16 * 1024
+
+_STATUS_RE = re.compile(r'^/api/rewrite/status/([\w-]+)$')
+_DOWNLOAD_RE = re.compile(r'^/api/rewrite/download/([\w-]+)$')
+
+def parse_distribution(spec):
+    """解析耗时分布，返回采样函数（单位：秒）
+
+    支持 fixed:0.2、uniform:0.1,0.5、exp:0.3（均值）、lognormal:0.3,0.5（中位数, sigma）。
+    """
+    try:
+        kind, _, args = spec.partition(':')
+        values = [float(v) for v in args.split(',')] if args else []
+        if kind == 'fixed':
+            value, = values
+            return lambda: value
+        if kind == 'uniform':
+            low, high = values
+            return lambda: random.uniform(low, high)
+        if kind == 'exp':
+            mean, = values
+            return lambda: random.expovariate(1 / mean) if mean > 0 else 0
+        if kind == 'lognormal':
+            median, sigma = values
+            return lambda: median * random.lognormvariate(0, sigma)
+    except ValueError:
+        pass
+    raise CommandError(f'无法解析的耗时分布: {spec}')
+
+class _TokenBucket:
+    """按每秒请求数限制吞吐"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+class AIGCSimulator:
+    """AIGC服务的本地替身：保存任务并按配置的处理能力模拟排队与完成时间"""
+
+    def __init__(self, options):
+        self.submit_latency = parse_distribution(options['submit_latency'])
+        self.status_latency = parse_distribution(options['status_latency'])
+        self.processing_time = parse_distribution(options['processing_time'])
+        self.submit_failure_rate = options['submit_failure_rate']
+        self.status_failure_rate = options['status_failure_rate']
+        self.task_failure_rate = options['task_failure_rate']
+        self.error_status = options['error_status']
+        self.download_rate = options['download_rate']
+        self.webhook_secret = options['webhook_secret']
+        self.rate_limiter = _TokenBucket(options['max_rps']) if options['max_rps'] else None
+
+        # 每个槽位下一次空闲的时间，槽位数即同时处理的任务数
+        self.slots = [0.0] * options['capacity'] if options['capacity'] else None
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.stats = {'submitted': 0, 'status': 0, 'download': 0, 'rejected': 0, 'errors': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def schedule(self, text, callback_url):
+        """创建任务并计算完成时间；处理能力已满时排在最早空闲的槽位之后"""
+        now = time.monotonic()
+        duration = self.processing_time()
+        task = {
+            'id': uuid.uuid4().hex,
+            'text': text,
+            'failed': random.random() < self.task_failure_rate,
+            'ai_detection_rate': round(random.uniform(0, 0.2), 4),
+            'callback_url': callback_url,
+        }
+
+        with self.lock:
+            if self.slots is None:
+                task['ready_at'] = now + duration
+            else:
+                start = max(now, heapq.heappop(self.slots))
+                task['ready_at'] = start + duration
+                heapq.heappush(self.slots, task['ready_at'])
+            self.tasks[task['id']] = task
+            self.stats['submitted'] += 1
+
+        if callback_url and self.webhook_secret:
+            timer = threading.Timer(task['ready_at'] - now, self.send_callback, args=(task,))
+            timer.daemon = True
+            timer.start()
+        return task
+
+    def task_status(self, task):
+        if time.monotonic() < task['ready_at']:
+            return {'task_id': task['id'], 'status': 'processing'}
+        if task['failed']:
+            return {'task_id': task['id'], 'status': 'failed', 'message': '模拟任务失败'}
+        return {'task_id': task['id'], 'status': 'completed', 'ai_detection_rate': task['ai_detection_rate']}
+
+    def send_callback(self, task):
+        body = json.dumps(self.task_status(task)).encode('utf-8')
+        timestamp = str(int(time.time()))
+        try:
+            requests.post(task['callback_url'], data=body, timeout=10, headers={
+                'Content-Type': 'application/json',
+                'X-AIGC-Timestamp': timestamp,
+                'X-AIGC-Signature': sign_webhook(self.webhook_secret, timestamp, body),
+            })
+        except requests.exceptions.RequestException:
+            self.count('errors')
+
+def _make_handler(simulator, verbose):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+        def _send_json(self, payload, status=200, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_body(self):
+            """读取请求体，支持分块传输编码与gzip压缩"""
+            if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                parts = []
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        break
+                    parts.append(self.rfile.read(size))
+                    self.rfile.readline()
+                body = b''.join(parts)
+            else:
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+                body = gzip.decompress(body)
+            return body
+
+        def _reject(self, failure_rate):
+            """按吞吐上限与故障率决定是否拒绝本次请求"""
+            if simulator.rate_limiter and not simulator.rate_limiter.take():
+                simulator.count('rejected')
+                self._send_json({'error': 'rate limited'}, status=429, headers={'Retry-After': '1'})
+                return True
+            if random.random() < failure_rate:
+                simulator.count('errors')
+                self._send_json({'error': 'simulated failure'}, status=simulator.error_status)
+                return True
+            return False
+
+        def do_POST(self):
+            body = self._read_body()
+
+            if self.path == '/api/rewrite/submit':
+                time.sleep(simulator.submit_latency())
+                if self._reject(simulator.submit_failure_rate):
+                    return
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    self._send_json({'error': 'invalid json'}, status=400)
+                    return
+                task = simulator.schedule(payload.get('text', ''), payload.get('callback_url'))
+                self._send_json({'task_id': task['id'], 'status': 'processing'})
+                return
+
+            if self.path == '/api/rewrite/status/batch':
+                time.sleep(simulator.status_latency())
+                if self._reject(simulator.status_failure_rate):
+                    return
+                task_ids = json.loads(body).get('task_ids', [])
+                simulator.count('status')
+                self._send_json({'tasks': {
+                    task_id: simulator.task_status(simulator.tasks[task_id])
+                    for task_id in task_ids if task_id in simulator.tasks
+                }})
+                return
+
+            self._send_json({'error': 'not found'}, status=404)
+
+        def do_GET(self):
+            match = _STATUS_RE.match(self.path)
+            if match:
+                time.sleep(simulator.status_latency())
+                if self._reject(simulator.status_failure_rate):
+                    return
+                task = simulator.tasks.get(match.group(1))
+                if task is None:
+                    self._send_json({'error': 'task not found'}, status=404)
+                    return
+                simulator.count('status')
+                self._send_json(simulator.task_status(task))
+                return
+
+            match = _DOWNLOAD_RE.match(self.path)
+            if match:
+                task = simulator.tasks.get(match.group(1))
+                if task is None or simulator.task_status(task)['status'] != 'completed':
+                    self._send_json({'error': 'result not ready'}, status=404)
+                    return
+                simulator.count('download')
+                self._send_download(task['text'].encode('utf-8'))
+                return
+
+            self._send_json({'error': 'not found'}, status=404)
+
+        def _send_download(self, content):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+
+            # 按配置的带宽分块写出，模拟慢速下载
+            for start in range(0, len(content), SIMULATOR_WRITE_BLOCK_SIZE):
+                block = content[start:start + SIMULATOR_WRITE_BLOCK_SIZE]
+                self.wfile.write(block)
+                if simulator.download_rate:
+                    time.sleep(len(block) / simulator.download_rate)
+
+    return Handler
+
+class Command(BaseCommand):
+    help = '启动本地AIGC服务模拟器，用于压测与延迟测试（将 AIGC_SERVICE_URL 指向它）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=5001)
+        parser.add_argument('--submit-latency', default='lognormal:0.2,0.5', help='提交接口的响应耗时分布')
+        parser.add_argument('--status-latency', default='uniform:0.01,0.05', help='状态接口的响应耗时分布')
+        parser.add_argument('--processing-time', default='lognormal:5,0.6', help='任务从开始处理到完成的耗时分布')
+        parser.add_argument('--capacity', type=int, default=0, help='同时处理的任务数，超出时排队；0 表示不限')
+        parser.add_argument('--max-rps', type=float, default=0, help='每秒接受的请求数上限，超出返回429；0 表示不限')
+        parser.add_argument('--submit-failure-rate', type=float, default=0, help='提交请求直接失败的比例')
+        parser.add_argument('--status-failure-rate', type=float, default=0, help='状态查询失败的比例')
+        parser.add_argument('--task-failure-rate', type=float, default=0, help='任务最终处理失败的比例')
+        parser.add_argument('--error-status', type=int, default=503, help='模拟失败时返回的状态码')
+        parser.add_argument('--download-rate', type=float, default=0, help='下载带宽（字节/秒）；0 表示不限')
+        parser.add_argument('--webhook-secret', default='', help='配置后任务完成时向 callback_url 发送签名回调')
+        parser.add_argument('--verbose', action='store_true', help='打印每个请求的访问日志')
+
+    def handle(self, *args, **options):
+        simulator = AIGCSimulator(options)
+        server = ThreadingHTTPServer((options['host'], options['port']), _make_handler(simulator, options['verbose']))
+        server.daemon_threads = True
+
+        # 以 SIGTERM 停止时同样输出统计
+        def _stop(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, _stop)
+
+        self.stdout.write(f"AIGC模拟器已启动: http://{options['host']}:{options['port']}（Ctrl+C 停止）")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'请求统计: {simulator.stats}')
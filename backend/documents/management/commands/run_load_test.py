@@ -0,0 +1,298 @@
+import json
+import math
+import time
+import uuid
+import random
+import shlex
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+from accounts.models import VerificationCode
+from .run_aigc_simulator import AIGCSimulator, _make_handler
+from .run_aigc_simulator import Command as SimulatorCommand
+
+# 上传文档的默认内容：若干段中文文本
+SAMPLE_PARAGRAPH = '人工智能生成的内容需要经过改写，才能更贴近作者自己的表达方式。'
+
+def percentile(sorted_values, p):
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def summarize(latencies, duration):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'throughput': round(len(values) / duration, 3) if duration else 0,
+        'mean_ms': round(sum(values) / len(values) * 1000, 1) if values else None,
+        'p50_ms': round(percentile(values, 50) * 1000, 1) if values else None,
+        'p95_ms': round(percentile(values, 95) * 1000, 1) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 1) if values else None,
+        'max_ms': round(values[-1] * 1000, 1) if values else None,
+    }
+
+class ScenarioError(Exception):
+    """场景中某一步返回了非预期结果"""
+
+class Recorder:
+    """按接口收集耗时与错误，线程安全"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, latency, error=None):
+        with self.lock:
+            self.latencies[name].append(latency)
+            if error is not None:
+                self.errors[name][error] += 1
+
+class VirtualUser:
+    """一个虚拟用户，按真实用户的操作顺序调用接口"""
+
+    def __init__(self, command, index):
+        self.command = command
+        self.options = command.options
+        self.recorder = command.recorder
+        self.base_url = self.options['base_url'].rstrip('/')
+        self.session = requests.Session()
+        self.email = f'load-{command.run_id}-{index}@example.com'
+        self.password = f'Load-{uuid.uuid4().hex[:12]}'
+
+    def call(self, name, method, path, expected=(200,), **kwargs):
+        """调用接口并按接口名记录耗时，返回响应；状态码不符合预期时抛出 ScenarioError"""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.options['timeout'], **kwargs)
+        except requests.exceptions.RequestException as e:
+            self.recorder.record(name, time.perf_counter() - started, type(e).__name__)
+            raise ScenarioError(f'{name}: {type(e).__name__}')
+
+        latency = time.perf_counter() - started
+        if response.status_code not in expected:
+            self.recorder.record(name, latency, f'HTTP {response.status_code}')
+            raise ScenarioError(f'{name}: HTTP {response.status_code} {response.text[:200]}')
+        self.recorder.record(name, latency)
+        return response
+
+    def register(self):
+        self.call('send_code', 'POST', '/api/v1/auth/send-code/', json={
+            'email': self.email, 'code_type': 'email_register'
+        })
+        # 邮件只输出到服务端，验证码从共享数据库中读取
+        code = VerificationCode.objects.filter(
+            email=self.email, code_type='email_register', is_used=False
+        ).order_by('-created_at').values_list('code', flat=True).first()
+        if code is None:
+            raise ScenarioError('send_code: 数据库中没有验证码，压测命令需与服务使用同一数据库')
+
+        self.call('register', 'POST', '/api/v1/auth/register/', expected=(201,), json={
+            'email': self.email, 'name': 'load', 'password': self.password,
+            'confirm_password': self.password, 'verification_code': code,
+        })
+        response = self.call('login', 'POST', '/api/v1/auth/login/', json={
+            'email': self.email, 'password': self.password, 'login_type': 'email',
+        })
+        self.session.headers['Authorization'] = f"Token {response.json()['tokens']['access']}"
+
+    def recharge(self):
+        packages = self.call('package_list', 'GET', '/api/v1/payments/api/packages/').json()['results']
+        if not packages:
+            raise ScenarioError('package_list: 没有可用的充值套餐，请先运行 init_data.py')
+
+        package = max(packages, key=lambda p: p['credits'])
+        response = self.call('create_recharge_order', 'POST', '/api/v1/payments/api/payments/create_recharge_order/',
+                             expected=(201,), json={'package_id': package['id'], 'payment_method': 'mock'})
+        payment_id = response.json()['payment_id']
+        self.call('mock_payment_success', 'POST', f'/api/v1/payments/api/payments/{payment_id}/mock_payment_success/')
+        self.call('recharge_history', 'GET', '/api/v1/payments/api/recharges/')
+
+    def wait_for_status(self, document_id, done):
+        """轮询文档状态直到 done(status) 为真，返回最终状态"""
+        deadline = time.monotonic() + self.options['poll_timeout']
+        while True:
+            status = self.call('document_status', 'GET', f'/api/v1/documents/{document_id}/status/').json()['status']
+            if done(status):
+                return status
+            if time.monotonic() >= deadline:
+                raise ScenarioError(f'document_status: {self.options["poll_timeout"]}秒内未完成，当前状态 {status}')
+            time.sleep(self.options['poll_interval'])
+
+    def process_document(self):
+        content = self.command.document_content
+        response = self.call('upload_document', 'POST', '/api/v1/documents/upload/', expected=(201,),
+                             data={'title': f'压测文档 {self.email}'},
+                             files={'file': ('load-test.txt', content, 'text/plain')})
+        document_id = response.json()['document_id']
+
+        # 解析完成后才能计价下单
+        self.wait_for_status(document_id, lambda status: status != 'extracting')
+
+        response = self.call('create_order', 'POST', '/api/v1/orders/', expected=(201,),
+                             json={'document_id': document_id})
+        order_number = response.json()['order_number']
+        self.call('pay_order', 'POST', f'/api/v1/orders/{order_number}/pay/')
+        self.call('order_list', 'GET', '/api/v1/orders/list/')
+
+        if self.options['skip_processing']:
+            return
+
+        status = self.wait_for_status(document_id, lambda status: status in ('completed', 'failed'))
+        if status != 'completed':
+            raise ScenarioError('document_status: 文档处理失败')
+        self.call('download_document', 'GET', f'/api/v1/documents/{document_id}/download/')
+
+    def run(self):
+        """执行完整场景，返回 (耗时, 错误信息)"""
+        started = time.perf_counter()
+        try:
+            self.register()
+            self.recharge()
+            for _ in range(self.options['iterations']):
+                self.process_document()
+        except ScenarioError as e:
+            return time.perf_counter() - started, str(e)
+        finally:
+            self.session.close()
+            close_old_connections()
+        return time.perf_counter() - started, None
+
+class Command(BaseCommand):
+    help = (
+        '对运行中的服务做端到端压测：注册登录、充值、上传文档、下单支付、轮询状态并下载结果，'
+        '按接口统计吞吐量与 p50/p95/p99 延迟，结果可输出为JSON用于对比'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='被测服务地址')
+        parser.add_argument('--users', type=int, default=10, help='并发的虚拟用户数')
+        parser.add_argument('--ramp-up', type=float, default=0, help='在该秒数内逐步启动所有虚拟用户')
+        parser.add_argument('--iterations', type=int, default=1, help='每个虚拟用户处理的文档数')
+        parser.add_argument('--doc-paragraphs', type=int, default=50, help='上传文档的段落数')
+        parser.add_argument('--poll-interval', type=float, default=1, help='轮询文档状态的间隔（秒）')
+        parser.add_argument('--poll-timeout', type=float, default=300, help='等待文档处理完成的最长时间（秒）')
+        parser.add_argument('--timeout', type=float, default=30, help='单个请求的超时时间（秒）')
+        parser.add_argument('--skip-processing', action='store_true', help='支付后不等待处理完成，只压测接口本身')
+        parser.add_argument('--simulator-port', type=int, default=0,
+                            help='在该端口启动AIGC模拟器（服务的 AIGC_SERVICE_URL 需指向它）；0 表示不启动')
+        parser.add_argument('--simulator-args', default='',
+                            help='传给模拟器的参数，如 "--processing-time fixed:2 --capacity 20"')
+        parser.add_argument('--output', help='把结果写入该JSON文件')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['iterations'] < 1:
+            raise CommandError('--users 与 --iterations 必须大于0')
+
+        self.options = options
+        self.recorder = Recorder()
+        self.run_id = uuid.uuid4().hex[:8]
+        self.document_content = '\n\n'.join(
+            f'{i + 1}. {SAMPLE_PARAGRAPH * random.randint(2, 6)}' for i in range(options['doc_paragraphs'])
+        ).encode('utf-8')
+
+        server = self._start_simulator() if options['simulator_port'] else None
+        try:
+            results = self._run()
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        self._print(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"结果已写入 {options['output']}")
+
+    def _start_simulator(self):
+        parser = SimulatorCommand().create_parser('manage.py', 'run_aigc_simulator')
+        simulator_options = vars(parser.parse_args(shlex.split(self.options['simulator_args'])))
+        simulator = AIGCSimulator(simulator_options)
+
+        server = ThreadingHTTPServer(('127.0.0.1', self.options['simulator_port']), _make_handler(simulator, False))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.stdout.write(f"AIGC模拟器已启动: http://127.0.0.1:{self.options['simulator_port']}")
+        return server
+
+    def _run(self):
+        options = self.options
+        self.stdout.write(
+            f"开始压测 {options['base_url']}: {options['users']}个虚拟用户，每人{options['iterations']}篇文档"
+        )
+
+        def run_user(index):
+            if options['ramp_up']:
+                time.sleep(options['ramp_up'] * index / options['users'])
+            return VirtualUser(self, index).run()
+
+        started_at = timezone.now()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['users']) as executor:
+            outcomes = list(executor.map(run_user, range(options['users'])))
+        duration = time.perf_counter() - started
+
+        failures = defaultdict(int)
+        failure_samples = {}
+        for _, error in outcomes:
+            if error is not None:
+                step = error.split(':', 1)[0]
+                failures[step] += 1
+                failure_samples.setdefault(step, error)
+
+        endpoints = {}
+        for name, latencies in sorted(self.recorder.latencies.items()):
+            endpoints[name] = summarize(latencies, duration)
+            endpoints[name]['errors'] = dict(self.recorder.errors.get(name, {}))
+
+        total_requests = sum(len(latencies) for latencies in self.recorder.latencies.values())
+        return {
+            'run_id': self.run_id,
+            'started_at': started_at.isoformat(),
+            'config': {
+                key: options[key] for key in (
+                    'base_url', 'users', 'ramp_up', 'iterations', 'doc_paragraphs',
+                    'poll_interval', 'skip_processing', 'simulator_args'
+                )
+            },
+            'duration': round(duration, 3),
+            'requests': total_requests,
+            'throughput': round(total_requests / duration, 3) if duration else 0,
+            'scenarios': {
+                **summarize([elapsed for elapsed, error in outcomes if error is None], duration),
+                'failed': sum(failures.values()),
+                'failures': dict(failures),
+                'failure_samples': failure_samples,
+            },
+            'endpoints': endpoints,
+        }
+
+    def _print(self, results):
+        self.stdout.write(
+            f"\n耗时 {results['duration']}秒，共 {results['requests']} 个请求，"
+            f"吞吐量 {results['throughput']} 请求/秒"
+        )
+        self.stdout.write(f"{'接口':<24} {'请求数':>6} {'错误':>5} {'请求/秒':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for name, stats in results['endpoints'].items():
+            errors = sum(stats['errors'].values())
+            line = (
+                f"{name:<24} {stats['count']:>6} {errors:>5} {stats['throughput']:>8} "
+                f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}"
+            )
+            self.stdout.write(self.style.ERROR(line) if errors else line)
+
+        scenarios = results['scenarios']
+        self.stdout.write(
+            f"完整场景: 成功 {scenarios['count']}，失败 {scenarios['failed']}，"
+            f"p50 {scenarios['p50_ms']}ms，p95 {scenarios['p95_ms']}ms"
+        )
+        for step, count in scenarios['failures'].items():
+            self.stdout.write(self.style.ERROR(f"  失败于 {step}: {count}，例如 {scenarios['failure_samples'][step]}"))
@@ -0,0 +1,71 @@
+import time
+from contextlib import contextmanager
+import requests
+from django.db.models import Count
+from writepro_backend.metrics import Counter, Histogram, register_collector
+from .limiter import aigc_health_metrics
+from .models import Document
+
+aigc_request_duration = Histogram(
+    'aigc_request_duration_seconds', 'AIGC服务请求耗时', ('operation',)
+)
+aigc_request_errors = Counter(
+    'aigc_request_errors_total', 'AIGC服务请求失败次数', ('operation', 'reason')
+)
+
+# 阶段耗时从秒到小时级别
+document_stage_duration = Histogram(
+    'document_stage_duration_seconds', '文档处理各阶段耗时', ('stage',),
+    buckets=(0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+)
+
+def _error_reason(error):
+    if isinstance(error, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return 'connection'
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        if error.response.status_code == 429:
+            return 'throttled'
+        return 'http_5xx' if error.response.status_code >= 500 else 'http_4xx'
+    return 'other'
+
+@contextmanager
+def observe_aigc_request(operation):
+    """记录一次AIGC请求的耗时，失败时按原因计数"""
+    started = time.monotonic()
+    try:
+        yield
+    except Exception as e:
+        aigc_request_errors.inc(operation=operation, reason=_error_reason(e))
+        raise
+    finally:
+        aigc_request_duration.observe(time.monotonic() - started, operation=operation)
+
+def observe_stage(stage, seconds):
+    """记录文档处理阶段耗时"""
+    document_stage_duration.observe(max(seconds, 0), stage=stage)
+
+@register_collector
+def document_status_counts():
+    """各状态的文档数"""
+    counts = dict(Document.objects.values_list('status').annotate(total=Count('id')).order_by())
+    return [(
+        'documents', 'gauge', '各状态的文档数',
+        [({'status': value}, counts.get(value, 0)) for value, _ in Document.STATUS_CHOICES]
+    )]
+
+_BREAKER_STATES = ('closed', 'half_open', 'open')
+
+@register_collector
+def aigc_health():
+    """AIGC限流与熔断状态"""
+    health = aigc_health_metrics()
+    return [
+        ('aigc_concurrency_limit', 'gauge', 'AIGC提交的并发上限', [({}, health['concurrency_limit'])]),
+        ('aigc_in_flight', 'gauge', '在途的AIGC提交数', [({}, health['in_flight'])]),
+        ('aigc_breaker_failures', 'gauge', '熔断统计窗口内的服务不可用次数', [({}, health['breaker_failures'])]),
+        ('aigc_breaker_state', 'gauge', '熔断器状态，当前状态为1', [
+            ({'state': state}, int(health['breaker_state'] == state)) for state in _BREAKER_STATES
+        ]),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
 import uuid
 import os
 
@@ -15,10 +17,20 @@ def processed_document_upload_path(instance, filename):
     filename = f"processed_{uuid.uuid4()}.{ext}"
     return os.path.join('documents', 'processed', str(instance.user.id), filename)
 
+def extracted_text_path(content_hash):
+    """提取文本的存储路径，按原文件内容哈希共享"""
+    return os.path.join('documents', 'extracted', content_hash[:2], f"{content_hash}.txt.gz")
+
+def upload_session_expiry():
+    """分片上传会话的过期时间，每收到一个分片顺延"""
+    return timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
 class Document(models.Model):
     STATUS_CHOICES = [
         ('uploaded', '已上传'),
+        ('extracting', '解析中'),
         ('processing', '处理中'),
+        ('queued', '排队中'),
         ('completed', '已完成'),
         ('failed', '处理失败'),
     ]
@@ -33,6 +45,8 @@ class Document(models.Model):
     file_size = models.BigIntegerField()  # 文件大小（字节）
     file_type = models.CharField(max_length=50)  # 文件类型
     word_count = models.IntegerField(default=0)  # 字数
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)  # 原文件SHA-256
+    extracted_text = models.FileField(max_length=255, null=True, blank=True)  # gzip压缩的提取文本
     
     # 处理状态
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploaded')
@@ -53,6 +67,10 @@ class Document(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # 用户文档列表与游标分页
+            models.Index(fields=['user', '-created_at', '-id'], name='document_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.user.name}"
@@ -62,6 +80,57 @@ class Document(models.Model):
         """文件大小（MB）"""
         return round(self.file_size / (1024 * 1024), 2)
 
+class DocumentSegment(models.Model):
+    """文档改写分段，长文档切分后分别提交AIGC服务"""
+    STATUS_CHOICES = [
+        ('pending', '待提交'),
+        ('submitted', '处理中'),
+        ('ready', '待下载'),
+        ('completed', '已完成'),
+        ('failed', '处理失败'),
+    ]
+    
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='segments')
+    index = models.IntegerField()  # 分段序号
+    source_offset = models.BigIntegerField()  # 在提取文本中的字符偏移
+    source_text = models.TextField()
+    cache_key = models.CharField(max_length=64, null=True, blank=True)  # 改写缓存键
+    result_text = models.TextField(null=True, blank=True)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    aigc_task_id = models.CharField(max_length=255, null=True, blank=True)
+    ai_detection_rate = models.FloatField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)  # 已提交次数
+    submitted_at = models.DateTimeField(null=True, blank=True)  # 最近一次提交时间，用于超时判断
+    next_check_at = models.DateTimeField(null=True, blank=True, db_index=True)  # 下一次轮询时间
+    error_message = models.TextField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['document', 'index']
+        unique_together = [('document', 'index')]
+    
+    def __str__(self):
+        return f"{self.document.title} - 第{self.index + 1}段"
+
+class RewriteCacheEntry(models.Model):
+    """AIGC改写结果缓存，按规范化分段文本、改写类型与目标语言的哈希寻址"""
+    key = models.CharField(max_length=64, unique=True)
+    result_text = models.TextField()
+    ai_detection_rate = models.FloatField(null=True, blank=True)
+    size = models.IntegerField()  # 结果文本字节数，用于按容量淘汰
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        ordering = ['-last_used_at']
+    
+    def __str__(self):
+        return f"{self.key[:12]} ({self.hit_count}次命中)"
+
 class DocumentProcessingLog(models.Model):
     """文档处理日志"""
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='processing_logs')
@@ -71,8 +140,46 @@ class DocumentProcessingLog(models.Model):
     details = models.JSONField(null=True, blank=True)  # 详细信息
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        # 批量写入的日志创建时间可能相同，按主键保持写入顺序
+        ordering = ['-created_at', '-id']
+    
+    def __str__(self):
+        return f"{self.document.title} - {self.step}"
+
+class UploadSession(models.Model):
+    """分片上传会话"""
+    STATUS_CHOICES = [
+        ('uploading', '上传中'),
+        ('completed', '已完成'),
+        ('cancelled', '已取消'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, blank=True, default='')
+    rewrite_type = models.CharField(max_length=50, default='standard')
+    target_language = models.CharField(max_length=10, default='zh')
+    
+    total_size = models.BigIntegerField()  # 文件总大小（字节）
+    received_size = models.BigIntegerField(default=0)  # 已接收字节数，即下一个分片的偏移
+    checksum = models.CharField(max_length=64, null=True, blank=True)  # 完整文件SHA-256（可选）
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    document = models.OneToOneField(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session')
+    chunk_reserved_until = models.DateTimeField(null=True, blank=True)  # 正在写入的分片占用的租约，期间其他分片请求被拒绝
+    expires_at = models.DateTimeField(default=upload_session_expiry)  # 过期后由 cleanup_upload_sessions 清理
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
     class Meta:
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.document.title} - {self.step}"
\ No newline at end of file
+        return f"{self.filename} ({self.received_size}/{self.total_size})"
+    
+    @property
+    def temp_path(self):
+        """分片追加写入的临时文件路径"""
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', 'partial', f"{self.id}.part")
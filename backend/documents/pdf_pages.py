@@ -0,0 +1,12 @@
+"""PDF分页提取的子进程入口
+
+进程池以 forkserver/spawn 方式启动子进程，子进程只导入本模块，
+因此这里不能导入 Django 或项目中依赖 Django 的模块。
+"""
+import PyPDF2
+
+def extract_pdf_pages(file_path, start, end):
+    """在子进程中提取 [start, end) 页的文本"""
+    with open(file_path, 'rb') as f:
+        pdf_reader = PyPDF2.PdfReader(f)
+        return [pdf_reader.pages[i].extract_text() or '' for i in range(start, end)]
@@ -1,7 +1,38 @@
 from rest_framework import serializers
-from .models import Document, DocumentProcessingLog
+from django.conf import settings
+from .models import Document, DocumentProcessingLog, UploadSession
 import os
 
+ALLOWED_EXTENSIONS = ['.txt', '.doc', '.docx', '.pdf']
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50MB
+
+def validate_upload(filename, size):
+    """检查上传文件的大小与类型"""
+    if size > MAX_UPLOAD_SIZE:
+        raise serializers.ValidationError("文件大小不能超过50MB")
+    
+    file_extension = os.path.splitext(filename)[1].lower()
+    
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise serializers.ValidationError(
+            f"不支持的文件类型。支持的格式: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+
+def create_uploaded_document(user, file, **fields):
+    """根据已落盘的上传文件创建文档，文本解析由 extract_document_text 异步完成"""
+    # 如果没有提供标题，使用文件名
+    if not fields.get('title'):
+        fields['title'] = os.path.splitext(file.name)[0]
+    
+    return Document.objects.create(
+        user=user,
+        original_file=file,
+        file_size=file.size,
+        file_type=os.path.splitext(file.name)[1].lower(),
+        status='extracting',
+        **fields
+    )
+
 class DocumentSerializer(serializers.ModelSerializer):
     file_size_mb = serializers.ReadOnlyField()
     original_filename = serializers.SerializerMethodField()
@@ -34,38 +65,48 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
         fields = ['file', 'title', 'rewrite_type', 'target_language']
     
     def validate_file(self, value):
-        # 检查文件大小 (50MB限制)
-        if value.size > 50 * 1024 * 1024:
-            raise serializers.ValidationError("文件大小不能超过50MB")
-        
-        # 检查文件类型
-        allowed_extensions = ['.txt', '.doc', '.docx', '.pdf']
-        file_extension = os.path.splitext(value.name)[1].lower()
-        
-        if file_extension not in allowed_extensions:
-            raise serializers.ValidationError(
-                f"不支持的文件类型。支持的格式: {', '.join(allowed_extensions)}"
-            )
-        
+        validate_upload(value.name, value.size)
         return value
     
     def create(self, validated_data):
         file = validated_data.pop('file')
         user = self.context['request'].user
         
-        # 如果没有提供标题，使用文件名
-        if not validated_data.get('title'):
-            validated_data['title'] = os.path.splitext(file.name)[0]
-        
-        document = Document.objects.create(
-            user=user,
-            original_file=file,
-            file_size=file.size,
-            file_type=os.path.splitext(file.name)[1].lower(),
-            **validated_data
-        )
-        
-        return document
+        return create_uploaded_document(user, file, **validated_data)
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received_size', read_only=True)
+    chunk_size = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'title', 'rewrite_type', 'target_language',
+            'total_size', 'checksum', 'offset', 'chunk_size', 'status',
+            'document', 'expires_at', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'status', 'document', 'expires_at', 'created_at', 'updated_at']
+        extra_kwargs = {
+            'title': {'required': False},
+            'rewrite_type': {'required': False},
+            'target_language': {'required': False},
+            'checksum': {'required': False},
+        }
+    
+    def get_chunk_size(self, obj):
+        return settings.UPLOAD_CHUNK_MAX_SIZE
+    
+    def validate(self, attrs):
+        validate_upload(attrs['filename'], attrs['total_size'])
+        return attrs
+    
+    def validate_checksum(self, value):
+        if value and len(value) != 64:
+            raise serializers.ValidationError("checksum 必须是SHA-256十六进制字符串")
+        return value.lower() if value else value
+    
+    def create(self, validated_data):
+        return UploadSession.objects.create(user=self.context['request'].user, **validated_data)
 
 class DocumentProcessingLogSerializer(serializers.ModelSerializer):
     class Meta:
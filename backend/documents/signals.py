@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .events import publish_document_event
+from .models import Document, DocumentProcessingLog
+
+# 事务提交后再推送，订阅方收到事件时查询到的一定是已提交的数据，回滚的修改也不会被推送
+
+@receiver(post_save, sender=Document)
+def publish_document_status(sender, instance, **kwargs):
+    """文档保存后推送最新状态与进度"""
+    from .utils import get_document_progress
+    transaction.on_commit(
+        lambda: publish_document_event(instance.id, 'status', get_document_progress(instance))
+    )
+
+@receiver(post_save, sender=DocumentProcessingLog)
+def publish_log_created(sender, instance, created, **kwargs):
+    """新增处理日志时推送日志步骤"""
+    if created:
+        from .utils import publish_processing_log
+        transaction.on_commit(lambda: publish_processing_log(instance))
@@ -4,8 +4,16 @@ from . import views
 urlpatterns = [
     path('upload/', views.upload_document, name='upload_document'),
     path('list/', views.document_list, name='document_list'),
+    path('status/', views.bulk_document_status, name='bulk_document_status'),
+    path('uploads/', views.create_upload_session, name='create_upload_session'),
+    path('uploads/<uuid:upload_id>/', views.upload_session_detail, name='upload_session_detail'),
+    path('uploads/<uuid:upload_id>/chunk/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/finalize/', views.finalize_upload, name='finalize_upload'),
+    path('aigc/callback/', views.aigc_callback, name='aigc_callback'),
+    path('aigc/metrics/', views.aigc_metrics, name='aigc_metrics'),
     path('<uuid:document_id>/', views.document_detail, name='document_detail'),
     path('<uuid:document_id>/status/', views.document_status, name='document_status'),
+    path('<uuid:document_id>/events/', views.document_events, name='document_events'),
     path('<uuid:document_id>/download/', views.download_document, name='download_document'),
     path('<uuid:document_id>/download/<str:file_type>/', views.download_document, name='download_document_type'),
     path('<uuid:document_id>/delete/', views.delete_document, name='delete_document'),
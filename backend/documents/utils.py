@@ -1,186 +1,1024 @@
 import os
+import gzip
+import uuid
+import hashlib
+import tempfile
+import time
+import threading
+import unicodedata
+import multiprocessing
 import requests
+from collections import deque
+from contextlib import contextmanager
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.cache import cache
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Case, Count, DateTimeField, F, FloatField, Min, Q, Sum, TextField, Value, When
+from django.utils import timezone
 from celery import shared_task
-from .models import Document, DocumentProcessingLog
+from .aigc import AIGCThrottledError, AIGCUnavailableError, get_aigc_client, is_throttled_response, parse_retry_after
+from .events import publish_document_event
+from writepro_backend.logbuffer import add_log, buffered_logs, flush_logs, write_log
+from .limiter import acquire_submission_slot, aigc_breaker, aigc_limiter, release_submission_slot
+from .metrics import observe_stage
+from .models import Document, DocumentProcessingLog, DocumentSegment, RewriteCacheEntry, UploadSession, extracted_text_path
+from .pdf_pages import extract_pdf_pages
 import docx
 import PyPDF2
 import io
 
-def extract_text_from_file(file_path):
-    """从文件中提取文本内容"""
-    file_extension = os.path.splitext(file_path)[1].lower()
+# 流式读取纯文本时每次读取的字符数
+TEXT_READ_BLOCK_SIZE = 64 * 1024
+
+# 进程内复用的PDF提取进程池（按PID区分，fork之后重新创建）
+_pdf_executor = None
+_pdf_executor_pid = None
+# 提取队列的 worker 以线程池运行，多个任务线程共用同一个进程池
+_pdf_executor_lock = threading.Lock()
+
+def _get_pdf_executor():
+    """获取当前进程复用的PDF提取进程池"""
+    global _pdf_executor, _pdf_executor_pid
+    
+    with _pdf_executor_lock:
+        if _pdf_executor is None or _pdf_executor_pid != os.getpid():
+            # worker 以多线程运行，fork 会把其他线程持有的锁和连接复制进子进程，改用 forkserver/spawn
+            _pdf_executor = ProcessPoolExecutor(
+                max_workers=settings.PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context(settings.PDF_EXTRACT_START_METHOD)
+            )
+            _pdf_executor_pid = os.getpid()
+        return _pdf_executor
+
+def _reset_pdf_executor():
+    """丢弃已损坏的进程池，下次使用时重新创建"""
+    global _pdf_executor
+    
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=False, cancel_futures=True)
+    _pdf_executor = None
+
+def _can_extract_in_parallel():
+    """是否可以使用进程池提取PDF
+    
+    Celery prefork 的工作进程是守护进程，不允许再创建子进程。extract_document_text
+    被路由到 PDF_EXTRACT_QUEUE，消费该队列的 worker 需以 --pool=threads 或 --pool=solo 运行。
+    """
+    if settings.PDF_EXTRACT_WORKERS <= 1:
+        return False
+    if multiprocessing.current_process().daemon:
+        print(f"当前为守护进程，PDF改为串行提取；请以 --pool=threads 运行 {settings.PDF_EXTRACT_QUEUE} 队列的 worker")
+        return False
+    return True
+
+def _iter_pdf_pages_parallel(file_path, page_count):
+    """将页码区间分发到进程池，按页序依次生成每页文本"""
+    executor = _get_pdf_executor()
+    step = max(settings.PDF_PAGES_PER_TASK, 1)
+    ranges = deque((start, min(start + step, page_count)) for start in range(0, page_count, step))
+    # 限制同时在途的区间数，内存只与在途区间相关
+    max_in_flight = settings.PDF_EXTRACT_WORKERS * 2
+    pending = deque()
     
     try:
-        if file_extension == '.txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        
-        elif file_extension in ['.doc', '.docx']:
-            doc = docx.Document(file_path)
-            text = []
-            for paragraph in doc.paragraphs:
-                text.append(paragraph.text)
-            return '\n'.join(text)
-        
-        elif file_extension == '.pdf':
-            text = []
-            with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                for page in pdf_reader.pages:
-                    text.append(page.extract_text())
-            return '\n'.join(text)
-        
-        else:
-            raise ValueError(f"不支持的文件格式: {file_extension}")
+        while ranges or pending:
+            while ranges and len(pending) < max_in_flight:
+                pending.append(executor.submit(extract_pdf_pages, file_path, *ranges.popleft()))
+            yield from pending.popleft().result()
+    except BrokenProcessPool:
+        _reset_pdf_executor()
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+def _iter_raw_text(file_path, parallel=None):
+    """按文件类型逐块读取原始文本，块与块之间的分隔符已包含在块内
+    
+    parallel 为 None 时按页数阈值自动选择PDF的串行或并行提取，
+    True/False 强制使用并行或串行（仍受运行环境限制）。
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    
+    if file_extension == '.txt':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            while True:
+                block = f.read(TEXT_READ_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+    
+    elif file_extension in ['.doc', '.docx']:
+        doc = docx.Document(file_path)
+        for index, paragraph in enumerate(doc.paragraphs):
+            yield paragraph.text if index == 0 else '\n' + paragraph.text
+    
+    elif file_extension == '.pdf':
+        with open(file_path, 'rb') as f:
+            pdf_reader = PyPDF2.PdfReader(f)
+            page_count = len(pdf_reader.pages)
+            
+            if parallel is None:
+                parallel = page_count >= settings.PDF_PARALLEL_MIN_PAGES
+            
+            if parallel and _can_extract_in_parallel():
+                pages = _iter_pdf_pages_parallel(file_path, page_count)
+            else:
+                pages = (page.extract_text() or '' for page in pdf_reader.pages)
+            
+            for index, page_text in enumerate(pages):
+                yield page_text if index == 0 else '\n' + page_text
+    
+    else:
+        raise ValueError(f"不支持的文件格式: {file_extension}")
+
+def iter_text_chunks(file_path, parallel=None):
+    """逐页/逐段提取文本，依次生成 (offset, text)
     
+    PDF 按页、DOCX 按段落、TXT 按固定大小的块输出，所有 text 顺序拼接即为
+    完整文本，offset 为该块在完整文本中的字符偏移。峰值内存只取决于最大的一块。
+    页数达到 PDF_PARALLEL_MIN_PAGES 的PDF会分发到进程池并行提取，结果仍按页序输出。
+    """
+    offset = 0
+    
+    try:
+        for text in _iter_raw_text(file_path, parallel=parallel):
+            if not text:
+                continue
+            yield offset, text
+            offset += len(text)
     except Exception as e:
         raise Exception(f"文本提取失败: {str(e)}")
 
-def call_aigc_service(text, rewrite_type='standard', language='zh'):
-    """调用AIGC服务进行文本改写"""
-    url = f"{settings.AIGC_SERVICE_URL}/api/rewrite/submit"
+def extract_text_from_file(file_path):
+    """从文件中提取文本内容"""
+    return ''.join(text for _, text in iter_text_chunks(file_path))
+
+class TextStats:
+    """增量文本统计：字数、字符数与 SHA-256，不在内存中保留全文"""
     
-    data = {
-        'text': text,
-        'rewrite_type': rewrite_type,
-        'language': language
-    }
+    def __init__(self):
+        self.word_count = 0
+        self.char_count = 0
+        self._digest = hashlib.sha256()
     
+    def update(self, text):
+        self.word_count += len(text) - text.count(' ')
+        self.char_count += len(text)
+        self._digest.update(text.encode('utf-8'))
+    
+    def track(self, chunks):
+        """透传 (offset, text) 块，同时累计统计"""
+        for offset, text in chunks:
+            self.update(text)
+            yield offset, text
+    
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+def count_words(file_path):
+    """流式统计文件字数（不计空格）"""
+    stats = TextStats()
+    for _ in stats.track(iter_text_chunks(file_path)):
+        pass
+    return stats.word_count
+
+def compute_file_hash(file_path, block_size=1024 * 1024):
+    """分块计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _iter_gzip_text(full_path):
+    """逐块读取gzip压缩的文本，生成 (offset, text)"""
+    offset = 0
+    with gzip.open(full_path, 'rt', encoding='utf-8', newline='') as f:
+        while True:
+            block = f.read(TEXT_READ_BLOCK_SIZE)
+            if not block:
+                break
+            yield offset, block
+            offset += len(block)
+
+def ensure_extracted_text(document):
+    """提取并持久化文档文本，同时更新内容哈希与字数
+    
+    文本以gzip压缩保存，路径由原文件内容哈希决定，相同内容的文件只提取一次。
+    之后字数统计、计价、AIGC提交和预览都读取该文本，不再重新解析PDF/DOCX。
+    """
+    if document.extracted_text and os.path.exists(document.extracted_text.path):
+        return
+    
+    content_hash = compute_file_hash(document.original_file.path)
+    name = extracted_text_path(content_hash)
+    full_path = document.extracted_text.storage.path(name)
+    stats = TextStats()
+    
+    if os.path.exists(full_path):
+        # 已有相同内容的文件被提取过，直接复用
+        for _ in stats.track(_iter_gzip_text(full_path)):
+            pass
+    else:
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as f:
+                for _, text in stats.track(iter_text_chunks(document.original_file.path)):
+                    f.write(text)
+            # 原子替换，并发提取同一内容时不会读到半成品
+            os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    document.content_hash = content_hash
+    document.extracted_text.name = name
+    document.word_count = stats.word_count
+    document.save(update_fields=['content_hash', 'extracted_text', 'word_count', 'updated_at'])
+
+def iter_document_text(document):
+    """逐块读取文档的持久化提取文本，尚未提取时先提取并保存"""
+    ensure_extracted_text(document)
+    return _iter_gzip_text(document.extracted_text.path)
+
+def get_text_preview(document, max_chars=500):
+    """读取提取文本的开头部分用于预览"""
+    if not document.extracted_text or not os.path.exists(document.extracted_text.path):
+        return ''
+    
+    with gzip.open(document.extracted_text.path, 'rt', encoding='utf-8', newline='') as f:
+        return f.read(max_chars)
+
+def call_aigc_service(text, rewrite_type='standard', language='zh'):
+    """调用AIGC服务进行文本改写
+    
+    text 可以是字符串，也可以是 iter_text_chunks 生成的 (offset, text) 块，
+    后者以分块传输编码流式上传，不在内存中拼接全文。
+    """
     try:
-        response = requests.post(url, json=data, timeout=30)
-        response.raise_for_status()
-        return response.json()
+        return get_aigc_client().submit(
+            text,
+            rewrite_type=rewrite_type,
+            language=language,
+            callback_url=settings.AIGC_CALLBACK_URL or None
+        )
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        raise AIGCUnavailableError(f"AIGC服务调用失败: {str(e)}")
+    except requests.exceptions.HTTPError as e:
+        if is_throttled_response(e.response):
+            raise AIGCThrottledError(f"AIGC服务限流: {str(e)}", retry_after=parse_retry_after(e.response))
+        if e.response is not None and e.response.status_code >= 500:
+            raise AIGCUnavailableError(f"AIGC服务调用失败: {str(e)}")
+        raise Exception(f"AIGC服务调用失败: {str(e)}")
     except requests.exceptions.RequestException as e:
         raise Exception(f"AIGC服务调用失败: {str(e)}")
 
 def check_aigc_task_status(task_id):
     """检查AIGC任务状态"""
-    url = f"{settings.AIGC_SERVICE_URL}/api/rewrite/status/{task_id}"
-    
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return get_aigc_client().status(task_id)
     except requests.exceptions.RequestException as e:
         print(f"检查AIGC任务状态失败: {str(e)}")
         return None
 
 def download_aigc_result(task_id):
     """下载AIGC处理结果"""
-    url = f"{settings.AIGC_SERVICE_URL}/api/rewrite/download/{task_id}"
-    
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        return response.content
+        return get_aigc_client().download(task_id)
     except requests.exceptions.RequestException as e:
         raise Exception(f"下载AIGC结果失败: {str(e)}")
 
 @shared_task
-def process_document_with_aigc(document_id):
-    """异步处理文档"""
+@buffered_logs()
+def extract_document_text(document_id):
+    """异步提取文档文本并统计字数，完成后提交AIGC处理"""
+    document = Document.objects.filter(id=document_id).first()
+    if document is None:
+        return
+    
     try:
-        document = Document.objects.get(id=document_id)
+        started = time.monotonic()
+        ensure_extracted_text(document)
+        observe_stage('extraction', time.monotonic() - started)
         
-        # 记录开始处理
-        DocumentProcessingLog.objects.create(
+        document.status = 'uploaded'
+        document.save(update_fields=['status', 'updated_at'])
+        
+        write_log(
+            DocumentProcessingLog,
             document=document,
-            step='start_processing',
-            status='started',
-            message='开始处理文档'
+            step='text_extraction',
+            status='completed',
+            message=f'文本解析完成，共{document.word_count}字'
         )
+    
+    except Exception as e:
+        document.status = 'failed'
+        document.save(update_fields=['status', 'updated_at'])
         
-        # 更新状态为处理中
-        document.status = 'processing'
-        document.save()
-        
-        # 提取文本内容
-        text_content = extract_text_from_file(document.original_file.path)
+        write_log(
+            DocumentProcessingLog,
+            document=document,
+            step='upload_processing',
+            status='failed',
+            message=f'文档处理失败: {str(e)}'
+        )
         
-        DocumentProcessingLog.objects.create(
+        print(f"文档解析失败: {str(e)}")
+        return
+    
+    # 交给下一个任务前写入日志，保证日志顺序
+    flush_logs()
+    process_document_with_aigc.delay(document.id)
+
+# 分段边界，按优先级依次尝试：段落、换行、句末标点、分句标点
+SEGMENT_BOUNDARIES = [
+    ['\n\n'],
+    ['\n'],
+    ['。', '！', '？', '. ', '! ', '? '],
+    ['；', '; ', '，', ', '],
+]
+
+def _find_segment_cut(text, max_chars):
+    """在 text[:max_chars] 内寻找最靠后的自然边界，返回切分位置"""
+    for separators in SEGMENT_BOUNDARIES:
+        positions = [(text.rfind(sep, 0, max_chars), sep) for sep in separators]
+        cut = max((pos + len(sep) for pos, sep in positions if pos >= 0), default=0)
+        # 边界过于靠前时会产生很碎的分段，改用下一级边界
+        if cut >= max_chars // 2:
+            return cut
+    return max_chars
+
+def iter_text_segments(chunks, max_chars):
+    """将 (offset, text) 块切分为不超过 max_chars 的分段，生成 (offset, text)
+    
+    优先在段落、句子边界切分，所有分段顺序拼接即为原文。
+    """
+    buffer = ''
+    buffer_offset = 0
+    
+    for _, text in chunks:
+        buffer += text
+        while len(buffer) > max_chars:
+            cut = _find_segment_cut(buffer, max_chars)
+            yield buffer_offset, buffer[:cut]
+            buffer = buffer[cut:]
+            buffer_offset += cut
+    
+    if buffer:
+        yield buffer_offset, buffer
+
+def _prepare_segments(document):
+    """切分提取文本并保存分段；已有分段时直接复用，重新处理只涉及未完成的分段"""
+    if document.segments.exists():
+        return
+    
+    batch = []
+    chunks = iter_document_text(document)
+    for index, (offset, text) in enumerate(iter_text_segments(chunks, settings.AIGC_SEGMENT_MAX_CHARS)):
+        batch.append(DocumentSegment(
             document=document,
-            step='text_extraction',
-            status='completed',
-            message=f'文本提取完成，共{len(text_content)}字符'
+            index=index,
+            source_offset=offset,
+            source_text=text
+        ))
+        if len(batch) >= 100:
+            DocumentSegment.objects.bulk_create(batch)
+            batch = []
+    
+    if batch:
+        DocumentSegment.objects.bulk_create(batch)
+
+def normalize_segment_text(text):
+    """规范化分段文本：统一Unicode形式并合并空白，仅排版不同的段落命中同一缓存"""
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+def rewrite_cache_key(text, rewrite_type, language):
+    """改写缓存键：规范化文本 + 改写类型 + 目标语言的SHA-256"""
+    payload = f"{rewrite_type}\0{language}\0{normalize_segment_text(text)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _apply_rewrite_cache(document, segments):
+    """用缓存结果直接完成命中的分段，返回未命中、仍需提交AIGC服务的分段"""
+    if not settings.AIGC_REWRITE_CACHE_ENABLED:
+        return segments
+    
+    for segment in segments:
+        segment.cache_key = rewrite_cache_key(
+            segment.source_text, document.rewrite_type, document.target_language
+        )
+    
+    entries = {}
+    keys = list({segment.cache_key for segment in segments})
+    # 分批查询，避免超出数据库的参数个数限制
+    for start in range(0, len(keys), 500):
+        for entry in RewriteCacheEntry.objects.filter(key__in=keys[start:start + 500]):
+            entries[entry.key] = entry
+    
+    misses = []
+    for segment in segments:
+        entry = entries.get(segment.cache_key)
+        if entry:
+            segment.result_text = entry.result_text
+            segment.ai_detection_rate = entry.ai_detection_rate
+            segment.status = 'completed'
+        else:
+            misses.append(segment)
+    
+    DocumentSegment.objects.bulk_update(
+        segments, ['cache_key', 'result_text', 'ai_detection_rate', 'status'], batch_size=500
+    )
+    
+    hit_keys = list(entries)
+    for start in range(0, len(hit_keys), 500):
+        RewriteCacheEntry.objects.filter(key__in=hit_keys[start:start + 500]).update(
+            hit_count=F('hit_count') + 1,
+            last_used_at=timezone.now()
         )
+    
+    return misses
+
+def _store_rewrite_cache(segment):
+    """保存分段的改写结果，供之后内容相同的分段复用"""
+    if not settings.AIGC_REWRITE_CACHE_ENABLED or not segment.cache_key:
+        return
+    
+    RewriteCacheEntry.objects.update_or_create(
+        key=segment.cache_key,
+        defaults={
+            'result_text': segment.result_text,
+            'ai_detection_rate': segment.ai_detection_rate,
+            'size': len(segment.result_text.encode('utf-8')),
+            'last_used_at': timezone.now(),
+        }
+    )
+
+@shared_task
+def prune_rewrite_cache():
+    """淘汰长期未使用的改写缓存，总容量超限时再按最近使用时间淘汰"""
+    cutoff = timezone.now() - timedelta(days=settings.AIGC_REWRITE_CACHE_MAX_AGE_DAYS)
+    expired, _ = RewriteCacheEntry.objects.filter(last_used_at__lt=cutoff).delete()
+    
+    total_size = RewriteCacheEntry.objects.aggregate(total=Sum('size'))['total'] or 0
+    evict_ids = []
+    
+    if total_size > settings.AIGC_REWRITE_CACHE_MAX_BYTES:
+        entries = RewriteCacheEntry.objects.order_by('last_used_at').values_list('id', 'size')
+        for entry_id, size in entries.iterator():
+            if total_size <= settings.AIGC_REWRITE_CACHE_MAX_BYTES:
+                break
+            evict_ids.append(entry_id)
+            total_size -= size
+    
+    for start in range(0, len(evict_ids), 500):
+        RewriteCacheEntry.objects.filter(id__in=evict_ids[start:start + 500]).delete()
+    
+    return {'expired': expired, 'evicted': len(evict_ids)}
+
+@shared_task
+def cleanup_upload_sessions():
+    """清理过期的分片上传会话：删除未完成的会话，并删除所有过期会话遗留的临时文件"""
+    now = timezone.now()
+    expired = UploadSession.objects.filter(expires_at__lt=now).exclude(chunk_reserved_until__gt=now)
+    
+    removed_files = 0
+    for session in expired.iterator():
+        try:
+            os.remove(session.temp_path)
+            removed_files += 1
+        except FileNotFoundError:
+            pass
+    
+    # 已完成的会话关联着文档，只删除临时文件，保留记录
+    deleted, _ = expired.exclude(status='completed').delete()
+    return {'deleted': deleted, 'removed_files': removed_files}
+
+def _submit_pending_segments(document):
+    """在文档并发上限与全局限流名额内提交待处理及可重试的分段
+    
+    AIGC服务不可用或熔断器打开时停止提交，文档转为排队状态，分段不计入重试次数。
+    """
+    in_flight = document.segments.filter(status='submitted').count()
+    slots = settings.AIGC_SEGMENT_CONCURRENCY - in_flight
+    if slots <= 0:
+        return
+    
+    segments = document.segments.filter(status__in=['pending', 'failed']).order_by('index')[:slots]
+    for segment in segments:
+        lease = acquire_submission_slot()
+        if lease is None:
+            # 名额已满时等待下一次推进；熔断时整篇文档排队
+            if aigc_breaker.state() != 'closed':
+                _queue_document(document)
+            return
         
-        # 调用AIGC服务
-        aigc_result = call_aigc_service(
-            text=text_content,
-            rewrite_type=document.rewrite_type,
-            language=document.target_language
+        started = time.monotonic()
+        healthy = True
+        throttled = False
+        try:
+            aigc_result = call_aigc_service(
+                text=segment.source_text,
+                rewrite_type=document.rewrite_type,
+                language=document.target_language
+            )
+            if 'task_id' not in aigc_result:
+                raise Exception("AIGC服务返回格式错误")
+        except AIGCThrottledError as e:
+            # 服务在线但已饱和：分段保持原状态、不计重试次数，按 Retry-After 暂停提交后由下一次推进继续
+            throttled = True
+            aigc_limiter.pause(e.retry_after)
+            return
+        except AIGCUnavailableError as e:
+            healthy = False
+            segment.error_message = str(e)
+            segment.save()
+            _queue_document(document)
+            return
+        except Exception as e:
+            segment.attempts += 1
+            _mark_segment_failed(document, segment, str(e))
+            continue
+        finally:
+            release_submission_slot(lease, time.monotonic() - started, healthy, throttled)
+        
+        segment.attempts += 1
+        segment.aigc_task_id = aigc_result['task_id']
+        segment.status = 'submitted'
+        segment.submitted_at = timezone.now()
+        segment.next_check_at = segment.submitted_at + _first_poll_delay()
+        segment.error_message = None
+        segment.save()
+
+def _queue_document(document):
+    """AIGC服务不可用时让文档排队等待，而不是标记为失败"""
+    updated = Document.objects.filter(id=document.id, status='processing').update(
+        status='queued', updated_at=timezone.now()
+    )
+    document.status = 'queued'
+    
+    if updated:
+        # update() 不触发 post_save，状态变化需要单独推送
+        publish_document_event(document.id, 'status', get_document_progress(document))
+        write_log(
+            DocumentProcessingLog,
+            document=document,
+            step='aigc_unavailable',
+            status='queued',
+            message='AIGC服务暂时不可用，文档进入排队，服务恢复后继续处理'
         )
+
+def _first_poll_delay():
+    """提交后首次轮询的延迟；启用回调时轮询只作为兜底"""
+    if settings.AIGC_CALLBACK_URL:
+        return timedelta(seconds=settings.AIGC_POLL_MAX_INTERVAL)
+    return timedelta(seconds=settings.AIGC_POLL_INTERVAL)
+
+def _retry_log(segment, message):
+    """分段失败、等待重新提交的处理日志"""
+    return DocumentProcessingLog(
+        document_id=segment.document_id,
+        step='segment_retry',
+        status='retrying',
+        message=f'第{segment.index + 1}段处理失败，稍后重试: {message}',
+        details={'segment': segment.index, 'attempts': segment.attempts}
+    )
+
+def _mark_segment_failed(document, segment, message):
+    """记录分段失败，由下一次推进重新提交或判定文档失败"""
+    segment.status = 'failed'
+    segment.error_message = message
+    segment.save()
+    
+    if segment.attempts <= settings.AIGC_SEGMENT_MAX_RETRIES:
+        add_log(_retry_log(segment, message))
+
+def _raise_if_segments_exhausted(document):
+    """存在重试次数用尽的分段时，整篇文档失败"""
+    segment = document.segments.filter(
+        status='failed', attempts__gt=settings.AIGC_SEGMENT_MAX_RETRIES
+    ).order_by('index').first()
+    
+    if segment:
+        raise Exception(f"第{segment.index + 1}段处理失败: {segment.error_message}")
+
+def _download_ready_segments(document):
+    """下载远程已完成分段的改写结果并写入缓存"""
+    for segment in document.segments.filter(status='ready').order_by('index'):
+        try:
+            content = download_aigc_result(segment.aigc_task_id)
+        except Exception as e:
+            _mark_segment_failed(document, segment, str(e))
+            continue
         
-        if 'task_id' in aigc_result:
-            document.aigc_task_id = aigc_result['task_id']
-            document.save()
+        segment.result_text = content.decode('utf-8', errors='replace')
+        segment.status = 'completed'
+        segment.save()
+        _store_rewrite_cache(segment)
+
+def _assemble_processed_file(document):
+    """按顺序拼接分段结果，保存为处理后文件，返回按字数加权的AI检测率"""
+    weighted_rate = 0
+    total_chars = 0
+    
+    with tempfile.TemporaryFile() as tmp:
+        segments = document.segments.order_by('index').values_list('result_text', 'ai_detection_rate')
+        for result_text, ai_rate in segments.iterator():
+            tmp.write(result_text.encode('utf-8'))
+            weighted_rate += (ai_rate or 0) * len(result_text)
+            total_chars += len(result_text)
+        
+        tmp.seek(0)
+        filename = f"processed_{document.title}.txt"
+        document.processed_file.save(filename, File(tmp), save=False)
+    
+    return round(weighted_rate / total_chars, 4) if total_chars else 0
+
+def _finalize_if_complete(document):
+    """所有分段完成后拼接结果并将文档标记为已完成，返回是否已完成"""
+    with transaction.atomic():
+        document = Document.objects.select_for_update().get(id=document.id)
+        if document.status != 'processing':
+            return document.status == 'completed'
+        if document.segments.exclude(status='completed').exists():
+            return False
+        
+        document.ai_detection_rate_after = _assemble_processed_file(document)
+        document.status = 'completed'
+        document.processed_at = timezone.now()
+        document.save()
+        
+        write_log(
+            DocumentProcessingLog,
+            document=document,
+            step='processing_completed',
+            status='completed',
+            message='文档处理完成'
+        )
+    
+    first_submitted_at = document.segments.aggregate(first=Min('submitted_at'))['first']
+    if first_submitted_at is not None:
+        observe_stage('rewrite', (document.processed_at - first_submitted_at).total_seconds())
+    observe_stage('total', (document.processed_at - document.created_at).total_seconds())
+    return True
+
+def _fail_document(document, error):
+    """将文档标记为处理失败"""
+    document.status = 'failed'
+    document.save()
+    
+    write_log(
+        DocumentProcessingLog,
+        document=document,
+        step='processing_failed',
+        status='failed',
+        message=f'处理失败: {str(error)}'
+    )
+    
+    print(f"文档处理失败: {str(error)}")
+
+# 可以开始（或重新开始）AIGC处理的文档状态；处理中与排队中的文档由 advance_document 推进
+PROCESSABLE_STATUSES = ('uploaded', 'completed', 'failed')
+
+@contextmanager
+def _cache_lock(key, timeout):
+    """基于共享缓存的互斥锁，未获得锁时返回 False"""
+    acquired = cache.add(key, True, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(key)
+
+@shared_task
+@buffered_logs()
+def process_document_with_aigc(document_id):
+    """异步处理文档：切分为分段并提交AIGC服务，之后由 poll_aigc_tasks 与 advance_document 推进
+    
+    处理过程是可恢复的状态机，等待远程任务期间不占用Celery工作进程。
+    """
+    document = Document.objects.filter(id=document_id).first()
+    if document is None:
+        return
+    
+    started = time.monotonic()
+    try:
+        # 与 advance_document 使用同一把锁：认领、重置分段、切分与首次提交期间，
+        # 轮询触发的推进任务不会同时修改或提交同一文档的分段
+        with _cache_lock(f'aigc-advance-{document.id}', timeout=settings.AIGC_TASK_TIMEOUT) as acquired:
+            if not acquired:
+                # 上一轮的推进任务仍在运行，稍后重试
+                process_document_with_aigc.apply_async((document_id,), countdown=settings.AIGC_POLL_TICK)
+                return
+            
+            # 原子认领：已在处理中、排队中或仍在解析的文档不重复处理
+            claimed = Document.objects.filter(
+                id=document.id, status__in=PROCESSABLE_STATUSES
+            ).update(status='processing', updated_at=timezone.now())
+            if not claimed:
+                return
+            
+            document.refresh_from_db()
+            # update() 不触发 post_save，状态变化需要单独推送
+            publish_document_event(document.id, 'status', get_document_progress(document))
             
-            DocumentProcessingLog.objects.create(
+            write_log(
+                DocumentProcessingLog,
                 document=document,
-                step='aigc_submission',
+                step='start_processing',
+                status='started',
+                message='开始处理文档'
+            )
+            
+            # 读取已持久化的提取文本并切分
+            _prepare_segments(document)
+            segment_count = document.segments.count()
+            
+            write_log(
+                DocumentProcessingLog,
+                document=document,
+                step='text_segmentation',
                 status='completed',
-                message=f'已提交到AIGC服务，任务ID: {aigc_result["task_id"]}'
+                message=f'文本切分完成，共{segment_count}段',
+                details={'segments': segment_count, 'max_chars': settings.AIGC_SEGMENT_MAX_CHARS}
             )
             
-            # 轮询AIGC服务状态
-            import time
-            max_attempts = 60  # 最多等待10分钟
-            attempt = 0
+            # 重新处理时，未完成的分段（包括上次在途的）从头提交
+            document.segments.exclude(status='completed').update(status='pending', attempts=0)
+            
+            # 只处理尚未完成的分段，内容未变的分段直接使用改写缓存
+            segments = list(document.segments.exclude(status='completed').order_by('index'))
+            misses = _apply_rewrite_cache(document, segments)
             
-            while attempt < max_attempts:
-                time.sleep(10)  # 每10秒检查一次
-                attempt += 1
-                
-                status_result = check_aigc_task_status(document.aigc_task_id)
-                
-                if status_result:
-                    if status_result['status'] == 'completed':
-                        # 下载处理结果
-                        processed_content = download_aigc_result(document.aigc_task_id)
-                        
-                        # 保存处理后的文件
-                        filename = f"processed_{document.title}.txt"
-                        document.processed_file.save(
-                            filename,
-                            ContentFile(processed_content),
-                            save=False
-                        )
-                        
-                        # 更新文档状态
-                        document.status = 'completed'
-                        document.ai_detection_rate_after = status_result.get('ai_detection_rate', 0)
-                        document.save()
-                        
-                        DocumentProcessingLog.objects.create(
-                            document=document,
-                            step='processing_completed',
-                            status='completed',
-                            message='文档处理完成'
-                        )
-                        
-                        return
-                    
-                    elif status_result['status'] == 'failed':
-                        raise Exception(f"AIGC处理失败: {status_result.get('message', '未知错误')}")
+            write_log(
+                DocumentProcessingLog,
+                document=document,
+                step='rewrite_cache',
+                status='completed',
+                message=f'改写缓存命中{len(segments) - len(misses)}段，需提交{len(misses)}段',
+                details={'hits': len(segments) - len(misses), 'misses': len(misses)}
+            )
             
-            # 超时处理
-            raise Exception("AIGC处理超时")
+            # 提交前先写入准备阶段的日志，之后的状态查询由 poll_aigc_tasks 统一进行
+            flush_logs()
+            _submit_pending_segments(document)
         
-        else:
-            raise Exception("AIGC服务返回格式错误")
+        observe_stage('submission', time.monotonic() - started)
+        _raise_if_segments_exhausted(document)
+        if not _finalize_if_complete(document):
+            publish_document_progress(document)
     
     except Exception as e:
-        # 处理失败
-        document.status = 'failed'
-        document.save()
+        _fail_document(document, e)
+
+@shared_task
+@buffered_logs()
+def advance_document(document_id):
+    """推进文档处理：下载已完成分段、重新提交失败分段、补足并发名额，全部完成后拼接结果"""
+    with _cache_lock(f'aigc-advance-{document_id}', timeout=settings.AIGC_TASK_TIMEOUT) as acquired:
+        # 同一文档已有推进任务在运行，交给下一轮轮询
+        if not acquired:
+            return
         
-        DocumentProcessingLog.objects.create(
-            document=document,
-            step='processing_failed',
-            status='failed',
-            message=f'处理失败: {str(e)}'
+        document = Document.objects.filter(id=document_id).first()
+        if document is None or document.status not in ('processing', 'queued'):
+            return
+        
+        # 排队中的文档等熔断器冷却结束后恢复处理
+        if document.status == 'queued':
+            if aigc_breaker.state() == 'open':
+                return
+            document.status = 'processing'
+            document.save()
+        
+        try:
+            _download_ready_segments(document)
+            _raise_if_segments_exhausted(document)
+            _submit_pending_segments(document)
+            _raise_if_segments_exhausted(document)
+            if not _finalize_if_complete(document):
+                publish_document_progress(document)
+        except Exception as e:
+            _fail_document(document, e)
+
+def _next_poll_delay(segment, now):
+    """按任务已运行时长调整轮询间隔：新任务勤查，长任务少查"""
+    age = (now - segment.submitted_at).total_seconds() if segment.submitted_at else 0
+    delay = max(settings.AIGC_POLL_INTERVAL, age * settings.AIGC_POLL_AGE_FACTOR)
+    return timedelta(seconds=min(delay, settings.AIGC_POLL_MAX_INTERVAL))
+
+def _fetch_task_statuses(task_ids):
+    """批量查询AIGC任务状态，返回 {task_id: 状态字典}；查询失败的任务不在结果中"""
+    if settings.AIGC_BATCH_STATUS_PATH:
+        try:
+            return get_aigc_client().batch_status(task_ids, settings.AIGC_BATCH_STATUS_PATH)
+        except requests.exceptions.RequestException as e:
+            print(f"批量检查AIGC任务状态失败: {str(e)}")
+            return {}
+    
+    with ThreadPoolExecutor(max_workers=settings.AIGC_POLL_CONCURRENCY) as executor:
+        results = executor.map(check_aigc_task_status, task_ids)
+        return {task_id: result for task_id, result in zip(task_ids, results) if result}
+
+def apply_aigc_callback(task_id, remote_status, payload):
+    """处理AIGC服务的完成/失败回调，返回是否更新了分段
+    
+    只更新仍处于 submitted 状态的分段，未知任务、重复或迟到的回调（包括已被轮询处理的任务）不做任何操作。
+    """
+    if remote_status == 'completed':
+        changes = {'status': 'ready', 'ai_detection_rate': payload.get('ai_detection_rate', 0)}
+    elif remote_status == 'failed':
+        message = f"AIGC处理失败: {payload.get('message', '未知错误')}"
+        changes = {'status': 'failed', 'error_message': message}
+    else:
+        return False
+    
+    # 任务ID可能已被重新提交替换，或在多个分段间重复出现，只处理仍在等待该任务的一个分段
+    segment = DocumentSegment.objects.filter(aigc_task_id=task_id, status='submitted').order_by('pk').first()
+    if segment is None:
+        return False
+    
+    updated = DocumentSegment.objects.filter(
+        pk=segment.pk, aigc_task_id=task_id, status='submitted'
+    ).update(updated_at=timezone.now(), **changes)
+    if not updated:
+        return False
+    
+    if remote_status == 'failed' and segment.attempts <= settings.AIGC_SEGMENT_MAX_RETRIES:
+        add_log(_retry_log(segment, message))
+    advance_document.delay(str(segment.document_id))
+    return True
+
+def compute_progress(document_status, total_segments, completed_segments):
+    """根据文档状态与分段完成数计算进度百分比"""
+    progress = {'completed': 100, 'processing': 50, 'queued': 50, 'extracting': 10}.get(document_status, 0)
+    if document_status in ('processing', 'queued') and total_segments:
+        progress = min(int(completed_segments * 100 / total_segments), 99)
+    return progress
+
+def get_document_progress(document):
+    """返回文档的状态、进度百分比与分段统计
+    
+    分段处理的文档按已完成分段计算进度，拼接结果前最多为99。
+    """
+    segments = document.segments.aggregate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(status='completed'))
+    )
+    
+    return {
+        'status': document.status,
+        'progress': compute_progress(document.status, segments['total'], segments['completed']),
+        'segments': segments,
+        'ai_detection_rate_after': document.ai_detection_rate_after,
+    }
+
+def publish_document_progress(document):
+    """推送文档当前进度"""
+    publish_document_event(document.id, 'progress', get_document_progress(document))
+
+def publish_processing_log(log):
+    """推送一条处理日志"""
+    publish_document_event(log.document_id, 'log', {
+        'step': log.step,
+        'status': log.status,
+        'message': log.message,
+        'created_at': log.created_at,
+    })
+
+def _status_cache_key(task_id):
+    return f'aigc-status:{task_id}'
+
+def request_legacy_status_refresh(document):
+    """请求刷新旧版整篇提交文档的远程状态
+    
+    状态在缓存有效期内不重复查询；同一任务同时只会排入一个刷新任务，
+    多个页面同时轮询同一文档时最多触发一次远程调用。
+    """
+    key = _status_cache_key(document.aigc_task_id)
+    if cache.get(key) is not None:
+        return
+    if cache.add(f'{key}:refreshing', True, int(settings.AIGC_CONNECT_TIMEOUT + settings.AIGC_STATUS_TIMEOUT) * 2):
+        refresh_legacy_document_status.delay(str(document.id))
+
+@shared_task
+def refresh_legacy_document_status(document_id):
+    """查询旧版整篇提交文档的AIGC任务状态，缓存结果并更新文档"""
+    document = Document.objects.filter(id=document_id).first()
+    if document is None or not document.aigc_task_id:
+        return
+    
+    key = _status_cache_key(document.aigc_task_id)
+    try:
+        if document.status != 'processing':
+            return
+        
+        aigc_status = check_aigc_task_status(document.aigc_task_id)
+        # 查询失败也缓存，避免服务故障时每次请求都重新排队
+        cache.set(key, aigc_status or {'status': 'unknown'}, settings.AIGC_STATUS_CACHE_TTL)
+        
+        if aigc_status:
+            if aigc_status['status'] == 'completed':
+                # 更新文档状态
+                document.status = 'completed'
+                document.ai_detection_rate_after = aigc_status.get('ai_detection_rate', 0)
+                document.save()
+            elif aigc_status['status'] == 'failed':
+                document.status = 'failed'
+                document.save()
+    finally:
+        cache.delete(f'{key}:refreshing')
+
+def _per_row(values, pks, output_field):
+    """按主键逐行取值的 CASE 表达式"""
+    return Case(*[When(pk=pk, then=Value(values[pk])) for pk in pks], output_field=output_field)
+
+def _write_poll_results(segments, ready, failed, rescheduled):
+    """按结果分组批量写回轮询结果，查询次数与批量大小无关，返回实际写回的分段ID"""
+    if not segments:
+        return set()
+    task_ids = {segment.pk: segment.aigc_task_id for segment in segments}
+    guard = Q(status='submitted', aigc_task_id__in=set(task_ids.values()))
+    
+    with transaction.atomic():
+        # 查询期间分段可能已被回调或重新处理改变状态，只写回仍处于 submitted 且任务未变的分段
+        current = {
+            pk for pk, task_id in DocumentSegment.objects.select_for_update().filter(
+                guard, pk__in=list(task_ids)
+            ).values_list('pk', 'aigc_task_id')
+            if task_ids[pk] == task_id
+        }
+        now = timezone.now()
+        groups = [
+            (ready, lambda pks: {'status': 'ready', 'ai_detection_rate': _per_row(ready, pks, FloatField())}),
+            (failed, lambda pks: {'status': 'failed', 'error_message': _per_row(failed, pks, TextField())}),
+            (rescheduled, lambda pks: {'next_check_at': _per_row(rescheduled, pks, DateTimeField())}),
+        ]
+        for values, fields in groups:
+            pks = [pk for pk in values if pk in current]
+            if pks:
+                DocumentSegment.objects.filter(guard, pk__in=pks).update(updated_at=now, **fields(pks))
+    return current
+
+@shared_task
+@buffered_logs()
+def poll_aigc_tasks():
+    """集中轮询所有处理中文档的在途AIGC任务，批量更新分段状态并推进相关文档
+    
+    由 Celery beat 周期调用，取代每个文档各自的轮询；启用回调后作为丢失回调的兜底。
+    """
+    with _cache_lock('aigc-poller', timeout=settings.AIGC_POLL_TICK * 10) as acquired:
+        if not acquired:
+            return
+        
+        now = timezone.now()
+        segments = list(
+            DocumentSegment.objects.filter(
+                status='submitted',
+                document__status__in=['processing', 'queued'],
+                next_check_at__lte=now
+            ).order_by('next_check_at')[:settings.AIGC_POLL_BATCH_SIZE]
         )
         
-        print(f"文档处理失败: {str(e)}")
\ No newline at end of file
+        statuses = _fetch_task_statuses([segment.aigc_task_id for segment in segments]) if segments else {}
+        deadline = now - timedelta(seconds=settings.AIGC_TASK_TIMEOUT)
+        # 熔断期间查询不到结果是服务故障所致，不按超时判定分段失败
+        if aigc_breaker.state() == 'open':
+            deadline = None
+        
+        ready, failed, rescheduled = {}, {}, {}
+        for segment in segments:
+            status_result = statuses.get(segment.aigc_task_id)
+            remote_status = status_result.get('status') if status_result else None
+            
+            if remote_status == 'completed':
+                ready[segment.pk] = status_result.get('ai_detection_rate', 0)
+            elif remote_status == 'failed' or (deadline and segment.submitted_at and segment.submitted_at < deadline):
+                failed[segment.pk] = (
+                    f"AIGC处理失败: {status_result.get('message', '未知错误')}"
+                    if remote_status == 'failed' else "AIGC处理超时"
+                )
+            else:
+                rescheduled[segment.pk] = now + _next_poll_delay(segment, now)
+        
+        written = _write_poll_results(segments, ready, failed, rescheduled)
+        for segment in segments:
+            if segment.pk in failed and segment.pk in written and segment.attempts <= settings.AIGC_SEGMENT_MAX_RETRIES:
+                add_log(_retry_log(segment, failed[segment.pk]))
+        
+        # 有待下载、待重试或待提交分段的文档交给 advance_document 推进
+        document_ids = Document.objects.filter(
+            status__in=['processing', 'queued'],
+            segments__status__in=['ready', 'failed', 'pending']
+        ).values_list('id', flat=True).distinct()
+        
+        for document_id in document_ids:
+            advance_document.delay(str(document_id))
+        
+        return {'checked': len(segments), 'advanced': len(document_ids)}
@@ -1,70 +1,334 @@
 from rest_framework import status, generics
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count, Q
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse, Http404
-from .models import Document, DocumentProcessingLog
-from .serializers import DocumentSerializer, DocumentUploadSerializer, DocumentProcessingLogSerializer
-from .utils import extract_text_from_file, process_document_with_aigc
+from asgiref.sync import sync_to_async
+from rest_framework.authtoken.models import Token
+from django.utils import timezone
+from datetime import timedelta
+from .models import Document, DocumentProcessingLog, UploadSession, upload_session_expiry
+from .serializers import (
+    DocumentSerializer,
+    DocumentUploadSerializer,
+    DocumentProcessingLogSerializer,
+    UploadSessionSerializer,
+    create_uploaded_document
+)
+from .downloads import serve_document_file
+from .aigc import verify_webhook_signature
+from .events import iter_document_events
+from writepro_backend.logbuffer import buffered_logs, write_log
+from writepro_backend.pagination import KeysetPagination, projection_fields
+from .limiter import aigc_health_metrics
+from .metrics import observe_stage
+from .utils import (
+    apply_aigc_callback,
+    compute_file_hash,
+    compute_progress,
+    extract_document_text,
+    get_document_progress,
+    get_text_preview,
+    request_legacy_status_refresh
+)
 import os
-import mimetypes
+import time
+import uuid
+import json
+import hashlib
+
+# 批量状态查询一次最多的文档数
+BULK_STATUS_MAX_IDS = 100
+
+# 分片写入磁盘时每次从请求体读取的字节数
+UPLOAD_READ_BLOCK_SIZE = 64 * 1024
+
+class _PartialUploadFile(File):
+    """指向已完成分片上传临时文件的File，保存时由存储层直接移动而非复制"""
+    
+    def temporary_file_path(self):
+        return self.file.name
+
+def _start_document_pipeline(document):
+    """文件已落盘即返回，文本解析与字数统计在Celery中进行"""
+    try:
+        extract_document_text.delay(document.id)
+    except Exception as e:
+        document.status = 'failed'
+        document.save()
+        
+        write_log(
+            DocumentProcessingLog,
+            document=document,
+            step='upload_processing',
+            status='failed',
+            message=f'文档处理失败: {str(e)}'
+        )
+        
+        return Response({
+            'error': '文档处理失败',
+            'details': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'message': '文档上传成功，正在处理中',
+        'document_id': document.id,
+        'document': DocumentSerializer(document).data
+    }, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_document(request):
     """上传文档"""
+    started = time.monotonic()
     serializer = DocumentUploadSerializer(data=request.data, context={'request': request})
     
     if serializer.is_valid():
         document = serializer.save()
+        # 单次上传从解析请求体到文件落盘的耗时，与分片上传计入同一阶段
+        observe_stage('upload', time.monotonic() - started)
+        return _start_document_pipeline(document)
+    
+    return Response({
+        'error': '上传失败',
+        'details': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload_session(request):
+    """创建分片上传会话"""
+    serializer = UploadSessionSerializer(data=request.data, context={'request': request})
+    
+    if serializer.is_valid():
+        session = serializer.save()
         
-        # 异步处理文档
-        try:
-            # 提取文本和字数统计
-            text_content = extract_text_from_file(document.original_file.path)
-            document.word_count = len(text_content.replace(' ', ''))
-            document.save()
-            
-            # 提交到AIGC服务进行处理
-            process_document_with_aigc.delay(document.id)
+        os.makedirs(os.path.dirname(session.temp_path), exist_ok=True)
+        open(session.temp_path, 'wb').close()
+        
+        return Response({
+            'message': '上传会话已创建',
+            'upload_id': session.id,
+            'session': UploadSessionSerializer(session).data
+        }, status=status.HTTP_201_CREATED)
+    
+    return Response({
+        'error': '创建上传会话失败',
+        'details': serializer.errors
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_session_detail(request, upload_id):
+    """查询分片上传进度，或取消上传"""
+    session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+    
+    if request.method == 'DELETE':
+        if session.status == 'uploading':
+            session.status = 'cancelled'
+            session.save()
             
+            if os.path.exists(session.temp_path):
+                os.remove(session.temp_path)
+        
+        return Response({
+            'message': '上传已取消'
+        })
+    
+    return Response(UploadSessionSerializer(session).data)
+
+def _append_chunk(session, stream, offset, length):
+    """将请求体按块追加写入临时文件，返回 (写入字节数, SHA-256)
+    
+    读取中断时把文件截断回 offset，已确认的数据不受影响。
+    """
+    digest = hashlib.sha256()
+    written = 0
+    
+    with open(session.temp_path, 'r+b') as f:
+        f.seek(offset)
+        try:
+            while written < length:
+                block = stream.read(min(UPLOAD_READ_BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                digest.update(block)
+                written += len(block)
+        except Exception:
+            f.truncate(offset)
+            raise
+        
+        f.truncate(offset + written)
+    
+    return written, digest.hexdigest()
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, upload_id):
+    """上传一个分片
+    
+    请求体为分片的原始字节，请求头 Upload-Offset 必须等于当前偏移，
+    X-Chunk-SHA256 为该分片的SHA-256。校验失败的分片会被丢弃，客户端可查询偏移后重传。
+    同一会话同时只能写入一个分片，其他请求返回409。
+    """
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.headers.get('Content-Length') or 0)
+    except ValueError:
+        return Response({
+            'error': '缺少或无效的 Upload-Offset / Content-Length'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if length <= 0 or length > settings.UPLOAD_CHUNK_MAX_SIZE:
+        return Response({
+            'error': f'分片大小必须在1到{settings.UPLOAD_CHUNK_MAX_SIZE}字节之间'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    expected_checksum = request.headers.get('X-Chunk-SHA256', '').lower()
+    if not expected_checksum:
+        return Response({
+            'error': '缺少 X-Chunk-SHA256'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # 行锁只用于校验偏移并占用租约，分片数据在事务外写入，慢速上传不会长时间持有锁
+    with transaction.atomic():
+        session = get_object_or_404(
+            UploadSession.objects.select_for_update(), id=upload_id, user=request.user
+        )
+        
+        if session.status != 'uploading':
+            return Response({
+                'error': '上传会话已结束'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        now = timezone.now()
+        if offset != session.received_size or (session.chunk_reserved_until and session.chunk_reserved_until > now):
+            return Response({
+                'error': '分片偏移不匹配或已有分片正在上传',
+                'offset': session.received_size
+            }, status=status.HTTP_409_CONFLICT)
+        
+        if offset + length > session.total_size:
+            return Response({
+                'error': '分片超出文件总大小'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        session.chunk_reserved_until = now + timedelta(seconds=settings.UPLOAD_CHUNK_LEASE)
+        session.save(update_fields=['chunk_reserved_until', 'updated_at'])
+    
+    try:
+        written, checksum = _append_chunk(session, request.stream, offset, length)
+    except Exception:
+        UploadSession.objects.filter(id=session.id).update(chunk_reserved_until=None)
+        raise
+    
+    accepted = written == length and checksum == expected_checksum
+    if not accepted:
+        with open(session.temp_path, 'r+b') as f:
+            f.truncate(offset)
+    
+    updates = {'chunk_reserved_until': None, 'updated_at': timezone.now()}
+    if accepted:
+        updates.update(received_size=offset + written, expires_at=upload_session_expiry())
+    # 单条条件更新提交偏移并归还租约；写入期间会话被取消、清理或租约被接管时不更新
+    committed = UploadSession.objects.filter(
+        id=session.id, status='uploading', received_size=offset
+    ).update(**updates)
+    
+    if not committed:
+        return Response({
+            'error': '上传会话已结束或分片已被重新上传'
+        }, status=status.HTTP_409_CONFLICT)
+    
+    if not accepted:
+        return Response({
+            'error': '分片校验失败，请重新上传',
+            'offset': offset
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'offset': offset + written,
+        'total_size': session.total_size
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalize_upload(request, upload_id):
+    """完成分片上传并创建文档"""
+    with transaction.atomic():
+        session = get_object_or_404(
+            UploadSession.objects.select_for_update(), id=upload_id, user=request.user
+        )
+        
+        # 重复提交直接返回已创建的文档
+        if session.status == 'completed' and session.document:
             return Response({
                 'message': '文档上传成功，正在处理中',
-                'document_id': document.id,
-                'document': DocumentSerializer(document).data
-            }, status=status.HTTP_201_CREATED)
-            
-        except Exception as e:
-            document.status = 'failed'
-            document.save()
-            
-            DocumentProcessingLog.objects.create(
-                document=document,
-                step='upload_processing',
-                status='failed',
-                message=f'文档处理失败: {str(e)}'
-            )
+                'document_id': session.document.id,
+                'document': DocumentSerializer(session.document).data
+            })
+        
+        if session.status != 'uploading':
+            return Response({
+                'error': '上传会话已结束'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if session.received_size != session.total_size:
+            return Response({
+                'error': '文件尚未上传完成',
+                'offset': session.received_size
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if session.checksum and compute_file_hash(session.temp_path) != session.checksum:
+            session.status = 'cancelled'
+            session.save()
+            os.remove(session.temp_path)
             
             return Response({
-                'error': '文档处理失败',
-                'details': str(e)
+                'error': '文件校验失败，请重新上传'
             }, status=status.HTTP_400_BAD_REQUEST)
+        
+        with open(session.temp_path, 'rb') as f:
+            document = create_uploaded_document(
+                request.user,
+                _PartialUploadFile(f, name=session.filename),
+                title=session.title,
+                rewrite_type=session.rewrite_type,
+                target_language=session.target_language
+            )
+        
+        session.status = 'completed'
+        session.document = document
+        session.save()
     
-    return Response({
-        'error': '上传失败',
-        'details': serializer.errors
-    }, status=status.HTTP_400_BAD_REQUEST)
+    # 分片上传从创建会话到合并完成的总耗时
+    observe_stage('upload', (timezone.now() - session.created_at).total_seconds())
+    return _start_document_pipeline(document)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def document_list(request):
-    """获取用户的文档列表"""
-    documents = Document.objects.filter(user=request.user)
+    """获取用户的文档列表
+    
+    带 cursor 参数时按游标分页返回，见 KeysetPagination。
+    """
+    documents = Document.objects.filter(user=request.user).only(*projection_fields(DocumentSerializer))
+    
+    paginator = KeysetPagination(page_size=20)
+    if paginator.is_requested(request):
+        page = paginator.paginate_queryset(documents, request)
+        return paginator.get_paginated_response(DocumentSerializer(page, many=True).data)
+    
     serializer = DocumentSerializer(documents, many=True)
     return Response({
         'documents': serializer.data,
-        'count': documents.count()
+        'count': len(serializer.data)
     })
 
 @api_view(['GET'])
@@ -80,50 +344,69 @@ def document_detail(request, document_id):
     
     return Response({
         'document': serializer.data,
+        'text_preview': get_text_preview(document),
         'processing_logs': log_serializer.data
     })
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def download_document(request, document_id, file_type='processed'):
-    """下载文档"""
-    document = get_object_or_404(Document, id=document_id, user=request.user)
+def bulk_document_status(request):
+    """批量获取文档处理状态
     
-    if file_type == 'original':
-        file_field = document.original_file
-        filename_prefix = 'original_'
-    elif file_type == 'processed':
-        if not document.processed_file:
+    ?ids=<id>,<id>,... 指定文档（最多100个），不传时返回全部处理中的文档。
+    返回 [id, status, progress, updated_at] 元组；支持 If-None-Match，结果未变化时返回304。
+    """
+    documents = Document.objects.filter(user=request.user)
+    
+    ids = request.query_params.get('ids')
+    if ids:
+        try:
+            document_ids = [uuid.UUID(value) for value in ids.split(',') if value.strip()]
+        except ValueError:
             return Response({
-                'error': '处理后的文件不存在'
-            }, status=status.HTTP_404_NOT_FOUND)
-        file_field = document.processed_file
-        filename_prefix = 'processed_'
+                'error': '文档ID格式错误'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(document_ids) > BULK_STATUS_MAX_IDS:
+            return Response({
+                'error': f'一次最多查询{BULK_STATUS_MAX_IDS}个文档'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        documents = documents.filter(id__in=document_ids)
     else:
-        return Response({
-            'error': '无效的文件类型'
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
-    if not file_field or not os.path.exists(file_field.path):
-        raise Http404("文件不存在")
-    
-    # 准备文件响应
-    with open(file_field.path, 'rb') as f:
-        file_data = f.read()
+        documents = documents.filter(status__in=['extracting', 'processing', 'queued'])
     
-    # 设置响应头
-    content_type, _ = mimetypes.guess_type(file_field.path)
-    if not content_type:
-        content_type = 'application/octet-stream'
+    rows = documents.annotate(
+        total_segments=Count('segments'),
+        completed_segments=Count('segments', filter=Q(segments__status='completed'))
+    ).order_by('created_at').values_list(
+        'id', 'status', 'updated_at', 'total_segments', 'completed_segments'
+    )
     
-    filename = f"{filename_prefix}{document.title}{document.file_type}"
+    results = [
+        [str(document_id), document_status, compute_progress(document_status, total, completed), updated_at.isoformat()]
+        for document_id, document_status, updated_at, total, completed in rows
+    ]
     
-    response = HttpResponse(file_data, content_type=content_type)
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    response['Content-Length'] = len(file_data)
+    etag = '"%s"' % hashlib.md5(json.dumps(results).encode('utf-8')).hexdigest()
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
     
+    response = Response({
+        'fields': ['document_id', 'status', 'progress', 'updated_at'],
+        'documents': results
+    })
+    response['ETag'] = etag
     return response
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def download_document(request, document_id, file_type='processed'):
+    """下载文档"""
+    document = get_object_or_404(Document, id=document_id, user=request.user)
+    return serve_document_file(request, document, file_type)
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_document(request, document_id):
@@ -137,6 +420,14 @@ def delete_document(request, document_id):
     if document.processed_file and os.path.exists(document.processed_file.path):
         os.remove(document.processed_file.path)
     
+    # 提取文本按内容哈希共享，没有其他文档引用时才删除
+    if document.extracted_text and os.path.exists(document.extracted_text.path):
+        shared = Document.objects.filter(
+            content_hash=document.content_hash
+        ).exclude(id=document.id).exists()
+        if not shared:
+            os.remove(document.extracted_text.path)
+    
     document.delete()
     
     return Response({
@@ -149,28 +440,112 @@ def document_status(request, document_id):
     """获取文档处理状态"""
     document = get_object_or_404(Document, id=document_id, user=request.user)
     
-    # 如果有AIGC任务ID，查询AIGC服务状态
-    if document.aigc_task_id and document.status == 'processing':
-        from .utils import check_aigc_task_status
-        aigc_status = check_aigc_task_status(document.aigc_task_id)
-        
-        if aigc_status:
-            if aigc_status['status'] == 'completed':
-                # 更新文档状态
-                document.status = 'completed'
-                document.ai_detection_rate_after = aigc_status.get('ai_detection_rate', 0)
-                document.save()
-            elif aigc_status['status'] == 'failed':
-                document.status = 'failed'
-                document.save()
+    # 旧版整篇提交的文档有AIGC任务ID，远程状态由后台任务刷新，请求中不做网络调用；
+    # 启用回调时仅在长时间没有更新后才主动刷新
+    callback_overdue = not settings.AIGC_CALLBACK_URL or (
+        document.updated_at < timezone.now() - timedelta(seconds=settings.AIGC_POLL_MAX_INTERVAL)
+    )
+    if document.aigc_task_id and document.status == 'processing' and callback_overdue:
+        request_legacy_status_refresh(document)
+    
+    progress = get_document_progress(document)
     
     return Response({
         'document_id': document.id,
         'status': document.status,
-        'progress': 100 if document.status == 'completed' else (50 if document.status == 'processing' else 0),
+        'progress': progress['progress'],
+        'segments': progress['segments'],
         'ai_detection_rate_before': document.ai_detection_rate_before,
         'ai_detection_rate_after': document.ai_detection_rate_after,
         'word_count': document.word_count,
         'created_at': document.created_at,
         'updated_at': document.updated_at
-    })
\ No newline at end of file
+    })
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+@buffered_logs()
+def aigc_callback(request):
+    """AIGC服务任务完成/失败回调
+    
+    请求头 X-AIGC-Timestamp 与 X-AIGC-Signature 携带签名，签名为
+    HMAC-SHA256(AIGC_WEBHOOK_SECRET, "<timestamp>.<原始请求体>")。重复、过期或未知任务的回调直接返回成功。
+    """
+    # 签名基于原始请求体，必须在解析 request.data 之前读取
+    body = request.body
+    if not verify_webhook_signature(
+        settings.AIGC_WEBHOOK_SECRET,
+        request.headers.get('X-AIGC-Timestamp'),
+        body,
+        request.headers.get('X-AIGC-Signature'),
+        settings.AIGC_WEBHOOK_TOLERANCE
+    ):
+        return Response({
+            'error': '签名校验失败'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    task_id = request.data.get('task_id')
+    task_status = request.data.get('status')
+    if not task_id or task_status not in ('completed', 'failed'):
+        return Response({
+            'error': '回调参数错误',
+            'details': {'task_id': task_id, 'status': task_status}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    applied = apply_aigc_callback(task_id, task_status, request.data)
+    
+    return Response({
+        'message': '回调已处理' if applied else '回调已忽略',
+        'applied': applied
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def aigc_metrics(request):
+    """AIGC服务的并发上限、在途提交数与熔断器状态"""
+    return Response(aigc_health_metrics())
+
+async def _authenticate_event_stream(request):
+    """事件流的Token认证；EventSource 不能设置请求头，也接受 ?token= 参数"""
+    key = request.GET.get('token')
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) == 2 and auth[0] == 'Token':
+        key = auth[1]
+    if not key:
+        return None
+    
+    token = await Token.objects.select_related('user').filter(key=key).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+async def document_events(request, document_id):
+    """以SSE推送文档状态变化、处理日志与进度，文档完成或失败后结束
+    
+    需运行在ASGI服务器下，空闲连接不占用工作线程。长时间无事件时流会定期结束，客户端自动重连。
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': '不支持的请求方法'}, status=405)
+    
+    user = await _authenticate_event_stream(request)
+    if user is None:
+        return JsonResponse({'error': '身份认证失败'}, status=401)
+    
+    document = await Document.objects.filter(id=document_id, user=user).afirst()
+    if document is None:
+        return JsonResponse({'error': '文档不存在'}, status=404)
+    
+    async def snapshot():
+        current = await Document.objects.aget(id=document_id)
+        return await sync_to_async(get_document_progress)(current)
+    
+    response = StreamingHttpResponse(
+        iter_document_events(document.id, snapshot),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # 关闭nginx缓冲，事件立即送达客户端
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -36,6 +36,12 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # 用户订单列表与游标分页
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            # 下单时检查文档是否已有未完成订单
+            models.Index(fields=['document', 'status'], name='order_document_status_idx'),
+        ]
     
     def __str__(self):
         return f"订单 {self.order_number} - {self.user.name}"
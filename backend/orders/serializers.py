@@ -42,6 +42,10 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         except Document.DoesNotExist:
             raise serializers.ValidationError("文档不存在或无权访问")
         
+        # 字数在解析完成后才确定，解析期间无法计价
+        if document.status == 'extracting':
+            raise serializers.ValidationError("文档正在解析中，请稍后再试")
+        
         # 检查文档是否已有未完成的订单
         existing_order = Order.objects.filter(
             document=document,
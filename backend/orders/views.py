@@ -6,6 +6,8 @@ from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from .models import Order, OrderStatusHistory
 from .serializers import OrderSerializer, OrderCreateSerializer, OrderStatusHistorySerializer
+from documents.serializers import DocumentSerializer
+from writepro_backend.pagination import KeysetPagination, projection_fields
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -40,7 +42,17 @@ def create_order(request):
 @permission_classes([IsAuthenticated])
 def order_list(request):
     """获取用户订单列表"""
-    orders = Order.objects.filter(user=request.user)
+    # 只加载序列化需要的列
+    orders = Order.objects.filter(user=request.user).select_related('document').only(
+        *projection_fields(OrderSerializer),
+        *projection_fields(DocumentSerializer, prefix='document__')
+    ).prefetch_related('items')
+    
+    # 游标分页，翻页深度不影响查询耗时
+    keyset = KeysetPagination(page_size=10)
+    if keyset.is_requested(request):
+        page = keyset.paginate_queryset(orders, request)
+        return keyset.get_paginated_response(OrderSerializer(page, many=True).data)
     
     # 分页
     from rest_framework.pagination import PageNumberPagination
@@ -62,7 +74,10 @@ def order_list(request):
 @permission_classes([IsAuthenticated])
 def order_detail(request, order_number):
     """获取订单详情"""
-    order = get_object_or_404(Order, order_number=order_number, user=request.user)
+    order = get_object_or_404(
+        Order.objects.select_related('document').prefetch_related('items'),
+        order_number=order_number, user=request.user
+    )
     
     # 获取状态历史
     history = OrderStatusHistory.objects.filter(order=order)
@@ -76,7 +91,10 @@ def order_detail(request, order_number):
 @permission_classes([IsAuthenticated])
 def pay_order(request, order_number):
     """支付订单"""
-    order = get_object_or_404(Order, order_number=order_number, user=request.user)
+    order = get_object_or_404(
+        Order.objects.select_related('document').prefetch_related('items'),
+        order_number=order_number, user=request.user
+    )
     
     if order.status != 'pending':
         return Response({
@@ -134,7 +152,10 @@ def pay_order(request, order_number):
 @permission_classes([IsAuthenticated])
 def cancel_order(request, order_number):
     """取消订单"""
-    order = get_object_or_404(Order, order_number=order_number, user=request.user)
+    order = get_object_or_404(
+        Order.objects.select_related('document').prefetch_related('items'),
+        order_number=order_number, user=request.user
+    )
     
     if order.status not in ['pending', 'paid']:
         return Response({
@@ -169,20 +190,14 @@ def cancel_order(request, order_number):
 @permission_classes([IsAuthenticated])
 def download_order_result(request, order_number):
     """下载订单处理结果"""
-    order = get_object_or_404(Order, order_number=order_number, user=request.user)
+    order = get_object_or_404(Order.objects.select_related('document'), order_number=order_number, user=request.user)
     
     if order.status != 'completed':
         return Response({
             'error': '订单未完成，无法下载'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # 重定向到文档下载
-    from django.http import HttpResponseRedirect
-    from django.urls import reverse
+    # 与文档下载共用同一流式响应，省去一次重定向
+    from documents.downloads import serve_document_file
     
-    return HttpResponseRedirect(
-        reverse('download_document_type', kwargs={
-            'document_id': order.document.id,
-            'file_type': 'processed'
-        })
-    )
\ No newline at end of file
+    return serve_document_file(request, order.document, 'processed')
\ No newline at end of file
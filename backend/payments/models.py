@@ -93,7 +93,8 @@ class PaymentLog(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['-created_at']
+        # 批量写入的日志创建时间可能相同，按主键保持写入顺序
+        ordering = ['-created_at', '-id']
     
     def __str__(self):
         return f"{self.payment.transaction_id} - {self.action}"
@@ -114,6 +115,10 @@ class RechargeRecord(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # 充值历史与游标分页
+            models.Index(fields=['user', '-created_at', '-id'], name='recharge_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"充值 {self.amount} - {self.user.name}"
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import RechargePackage, Payment, RechargeRecord, PaymentLog
+from writepro_backend.logbuffer import write_log
 
 class RechargePackageSerializer(serializers.ModelSerializer):
     total_credits = serializers.ReadOnlyField()
@@ -51,7 +52,8 @@ class CreateRechargeOrderSerializer(serializers.Serializer):
         )
         
         # 记录日志
-        PaymentLog.objects.create(
+        write_log(
+            PaymentLog,
             payment=payment,
             action='create_order',
             status='success',
@@ -4,6 +4,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from writepro_backend.logbuffer import buffered_logs, write_log
+from writepro_backend.pagination import KeysetPagination, projection_fields
 from .models import RechargePackage, Payment, RechargeRecord, PaymentLog
 from .serializers import (
     RechargePackageSerializer, 
@@ -27,6 +29,7 @@ def package_list(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@buffered_logs()
 def create_recharge_order(request):
     """创建充值订单"""
     serializer = CreateRechargeOrderSerializer(data=request.data, context={'request': request})
@@ -53,9 +56,10 @@ def create_recharge_order(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@buffered_logs()
 def mock_payment_success(request, payment_id):
     """模拟支付成功"""
-    payment = get_object_or_404(Payment, id=payment_id, user=request.user)
+    payment = get_object_or_404(Payment.objects.select_related('package'), id=payment_id, user=request.user)
     
     if payment.status != 'pending':
         return Response({
@@ -82,7 +86,8 @@ def mock_payment_success(request, payment_id):
     )
     
     # 记录日志
-    PaymentLog.objects.create(
+    write_log(
+        PaymentLog,
         payment=payment,
         action='payment_success',
         status='success',
@@ -105,7 +110,7 @@ def mock_payment_success(request, payment_id):
 @permission_classes([IsAuthenticated])
 def payment_status(request, payment_id):
     """查询支付状态"""
-    payment = get_object_or_404(Payment, id=payment_id, user=request.user)
+    payment = get_object_or_404(Payment.objects.select_related('package'), id=payment_id, user=request.user)
     serializer = PaymentSerializer(payment)
     
     # 获取支付日志
@@ -121,7 +126,17 @@ def payment_status(request, payment_id):
 @permission_classes([IsAuthenticated])
 def recharge_history(request):
     """获取充值历史"""
-    records = RechargeRecord.objects.filter(user=request.user)
+    # 只加载序列化需要的列
+    records = RechargeRecord.objects.filter(user=request.user).select_related('payment__package').only(
+        *projection_fields(RechargeRecordSerializer),
+        'payment__payment_method', 'payment__transaction_id', 'payment__status', 'payment__package__name'
+    )
+    
+    # 游标分页，翻页深度不影响查询耗时
+    keyset = KeysetPagination(page_size=20)
+    if keyset.is_requested(request):
+        page = keyset.paginate_queryset(records, request)
+        return keyset.get_paginated_response(RechargeRecordSerializer(page, many=True).data)
     
     # 分页
     from rest_framework.pagination import PageNumberPagination
@@ -141,9 +156,10 @@ def recharge_history(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@buffered_logs()
 def cancel_payment(request, payment_id):
     """取消支付"""
-    payment = get_object_or_404(Payment, id=payment_id, user=request.user)
+    payment = get_object_or_404(Payment.objects.select_related('package'), id=payment_id, user=request.user)
     
     if payment.status not in ['pending', 'processing']:
         return Response({
@@ -154,7 +170,8 @@ def cancel_payment(request, payment_id):
     payment.save()
     
     # 记录日志
-    PaymentLog.objects.create(
+    write_log(
+        PaymentLog,
         payment=payment,
         action='cancel_payment',
         status='success',
@@ -173,7 +190,7 @@ def user_credits(request):
     user = request.user
     
     # 获取最近的充值记录
-    recent_recharges = RechargeRecord.objects.filter(user=user)[:5]
+    recent_recharges = RechargeRecord.objects.filter(user=user).select_related('payment__package')[:5]
     
     return Response({
         'current_credits': user.credits,
@@ -39,5 +39,7 @@ echo "收集静态文件..."
 python manage.py collectstatic --noinput
 
 # 启动开发服务器
+# 生产环境使用ASGI服务器，文档进度事件流（SSE）的空闲连接不占用工作线程：
+# gunicorn writepro_backend.asgi:application -k uvicorn.workers.UvicornWorker
 echo "启动开发服务器..."
 python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
@@ -0,0 +1,4 @@
+# 确保Django启动时加载Celery应用，视图中调用 .delay() 时使用项目配置的broker
+from celery_app import app as celery_app
+
+__all__ = ('celery_app',)
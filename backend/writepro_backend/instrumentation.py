@@ -0,0 +1,214 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from .metrics import http_request_duration
+
+_current = ContextVar('current_timing', default=None)
+
+class Timing:
+    """一次请求或一次任务执行期间的SQL统计"""
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = ''
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_sql = sql
+
+    def server_timing(self):
+        """编码为 Server-Timing 响应头，时间单位为毫秒"""
+        parts = [
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"',
+            f'view;dur={self.elapsed * 1000:.1f}',
+        ]
+        if self.queries:
+            parts.append(f'db-slowest;dur={self.slowest_time * 1000:.1f}')
+        return ', '.join(parts)
+
+class TimingReport:
+    """按视图名/任务名聚合的进程内统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def add(self, timing):
+        with self.lock:
+            entry = self.entries.get(timing.name)
+            if entry is None:
+                entry = self.entries[timing.name] = {
+                    'name': timing.name,
+                    'calls': 0,
+                    'total_time': 0.0,
+                    'max_time': 0.0,
+                    'queries': 0,
+                    'max_queries': 0,
+                    'sql_time': 0.0,
+                    'slowest_query_time': 0.0,
+                    'slowest_query': '',
+                }
+            entry['calls'] += 1
+            entry['total_time'] += timing.elapsed
+            entry['max_time'] = max(entry['max_time'], timing.elapsed)
+            entry['queries'] += timing.queries
+            entry['max_queries'] = max(entry['max_queries'], timing.queries)
+            entry['sql_time'] += timing.sql_time
+            if timing.slowest_time > entry['slowest_query_time']:
+                entry['slowest_query_time'] = timing.slowest_time
+                entry['slowest_query'] = timing.slowest_sql
+
+    def snapshot(self):
+        """按总耗时倒序返回统计，时间单位为毫秒"""
+        with self.lock:
+            entries = [dict(entry) for entry in self.entries.values()]
+
+        rows = []
+        for entry in sorted(entries, key=lambda e: e['total_time'], reverse=True):
+            calls = entry['calls']
+            rows.append({
+                'name': entry['name'],
+                'calls': calls,
+                'avg_ms': round(entry['total_time'] * 1000 / calls, 1),
+                'max_ms': round(entry['max_time'] * 1000, 1),
+                'avg_queries': round(entry['queries'] / calls, 1),
+                'max_queries': entry['max_queries'],
+                'avg_sql_ms': round(entry['sql_time'] * 1000 / calls, 1),
+                'sql_ratio': round(entry['sql_time'] / entry['total_time'], 3) if entry['total_time'] else 0,
+                'slowest_query_ms': round(entry['slowest_query_time'] * 1000, 1),
+                'slowest_query': entry['slowest_query'],
+            })
+        return rows
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
+
+timing_report = TimingReport()
+
+def _execute_wrapper(execute, sql, params, many, context):
+    """数据库执行包装器：把每条SQL的耗时计入当前的 Timing"""
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.record_query(sql, time.perf_counter() - started)
+
+def _on_connection_created(sender, connection, **kwargs):
+    # 每个线程的数据库连接都挂上包装器，未处于统计中时直接执行
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
+
+connection_created.connect(_on_connection_created)
+
+def start_timing(name):
+    """开始统计，返回 (timing, token)；需要与 finish_timing 成对调用"""
+    timing = Timing(name)
+    return timing, _current.set(timing)
+
+def finish_timing(timing, token):
+    """结束统计并计入进程内汇总，超过慢阈值时打印"""
+    timing.elapsed = time.perf_counter() - timing.started
+    _current.reset(token)
+    timing_report.add(timing)
+
+    if timing.elapsed * 1000 >= settings.INSTRUMENTATION_SLOW_MS:
+        print(
+            f"慢调用 {timing.name}: 耗时{timing.elapsed * 1000:.0f}ms，"
+            f"SQL {timing.queries}条/{timing.sql_time * 1000:.0f}ms，"
+            f"最慢SQL {timing.slowest_time * 1000:.0f}ms: {timing.slowest_sql[:200]}"
+        )
+    return timing
+
+@contextmanager
+def instrument(name):
+    """统计 with 块内的SQL次数、SQL耗时、最慢SQL和总耗时"""
+    timing, token = start_timing(name)
+    try:
+        yield timing
+    finally:
+        finish_timing(timing, token)
+
+def _view_name(request):
+    # 未匹配路由的请求归为一类，避免按路径产生无限多的统计项
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unresolved'
+
+
+class QueryTimingMiddleware:
+    """统计每个请求按视图汇总的SQL与耗时，写入 Server-Timing 响应头并记录请求耗时指标
+
+    流式响应只统计到视图返回为止，不包含响应体的生成时间。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.INSTRUMENTATION_ENABLED
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        with instrument('unresolved') as timing:
+            response = self.get_response(request)
+            timing.name = _view_name(request)
+        response['Server-Timing'] = timing.server_timing()
+        self._observe(request, response, timing)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        with instrument('unresolved') as timing:
+            response = await self.get_response(request)
+            timing.name = _view_name(request)
+        response['Server-Timing'] = timing.server_timing()
+        # 写入指标是同步的Redis调用，放到线程中执行，不阻塞事件循环
+        await sync_to_async(self._observe, thread_sensitive=False)(request, response, timing)
+        return response
+
+    def _observe(self, request, response, timing):
+        http_request_duration.observe(
+            timing.elapsed, view=timing.name, method=request.method, status=response.status_code
+        )
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    if settings.INSTRUMENTATION_ENABLED:
+        task.request.instrumentation = start_timing(task.name)
+
+def _task_postrun(task_id=None, task=None, **kwargs):
+    state = getattr(task.request, 'instrumentation', None)
+    if state is not None:
+        task.request.instrumentation = None
+        finish_timing(*state)
+
+def connect_celery_signals():
+    """让Celery任务与Web请求使用同样的统计"""
+    from celery.signals import task_postrun, task_prerun
+
+    task_prerun.connect(_task_prerun, weak=False)
+    task_postrun.connect(_task_postrun, weak=False)
@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import groupby
+from django.db import router, transaction
+from django.db.models.signals import post_save
+
+_active_writer = ContextVar('active_log_writer', default=None)
+
+class BufferedLogWriter:
+    """在内存中收集日志条目，flush 时按原顺序用 bulk_create 批量写入
+
+    写入后为每条日志发送 post_save(created=True)，与逐条 create 的信号行为一致。
+    """
+
+    def __init__(self):
+        self.pending = []
+
+    def add(self, entry):
+        self.pending.append(entry)
+        return entry
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        entries, self.pending = self.pending, []
+        try:
+            with transaction.atomic():
+                # 连续的同类日志合并为一次 bulk_create，保持整体顺序
+                for model, group in groupby(entries, key=type):
+                    model.objects.bulk_create(list(group))
+        except Exception:
+            # 写入失败时放回缓冲区，不丢弃日志
+            self.pending = entries + self.pending
+            raise
+
+        for entry in entries:
+            post_save.send(
+                sender=type(entry), instance=entry, created=True,
+                update_fields=None, raw=False, using=router.db_for_write(type(entry))
+            )
+
+    def close(self):
+        """最终写入，不抛出异常：批量写入失败时逐条写入，仍失败的日志计数后丢弃"""
+        try:
+            self.flush()
+            return
+        except Exception as e:
+            print(f"批量写入日志失败，改为逐条写入: {str(e)}")
+
+        entries, self.pending = self.pending, []
+        dropped = 0
+        for entry in entries:
+            try:
+                # 批量写入回滚后实例上可能残留主键，强制插入
+                entry.save(force_insert=True)
+            except Exception:
+                dropped += 1
+
+        if dropped:
+            print(f"丢弃{dropped}条无法写入的日志（共{len(entries)}条）")
+
+@contextmanager
+def buffered_logs():
+    """在 with 块（或被装饰的函数）内缓冲日志，退出时统一写入，发生异常时同样写入
+
+    嵌套使用时复用最外层的缓冲区。退出时的写入失败不会抛出，以免掩盖 with 块内的异常。
+    """
+    writer = _active_writer.get()
+    if writer is not None:
+        yield writer
+        return
+
+    writer = BufferedLogWriter()
+    token = _active_writer.set(writer)
+    try:
+        yield writer
+    finally:
+        _active_writer.reset(token)
+        writer.close()
+
+def add_log(entry):
+    """记录一条日志（未保存的模型实例）；处于 buffered_logs 中时加入缓冲，否则立即写入"""
+    writer = _active_writer.get()
+    if writer is None:
+        entry.save()
+        return entry
+    return writer.add(entry)
+
+def write_log(model, **fields):
+    """按字段创建一条日志，写入方式同 add_log"""
+    return add_log(model(**fields))
+
+def flush_logs():
+    """在步骤边界立即写入已缓冲的日志，例如把任务交给下一个工作进程之前"""
+    writer = _active_writer.get()
+    if writer is not None:
+        writer.flush()
@@ -0,0 +1,187 @@
+import time
+from contextlib import contextmanager
+import redis
+from django.conf import settings
+from .redis_client import get_redis
+
+# 所有进程的计数器与直方图累加到同一个Redis哈希，/metrics 读取时即为全局汇总
+SERIES_KEY = 'metrics:series'
+
+# 秒级延迟的默认分桶
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metric:
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _metrics.append(self)
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'指标 {self.name} 的标签应为 {self.labelnames}')
+        return [(name, labels[name]) for name in self.labelnames]
+
+    def _increments(self, amount, labels):
+        """返回需要累加的 (序列名, 增量) 列表"""
+        raise NotImplementedError
+
+    def _record(self, amount, labels):
+        if not settings.METRICS_ENABLED:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for field, increment in self._increments(amount, labels):
+                pipe.hincrbyfloat(SERIES_KEY, field, increment)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"写入指标失败: {str(e)}")
+
+    def header(self):
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.metric_type}',
+        ]
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._record(amount, labels)
+
+    def _increments(self, amount, labels):
+        return [(self.name + _format_labels(self._labels(labels)), amount)]
+
+    def expose(self, series):
+        lines = self.header()
+        prefix = self.name + '{' if self.labelnames else self.name
+        for field in sorted(series):
+            if field == self.name or field.startswith(prefix):
+                lines.append(f'{field} {_format_value(series[field])}')
+        return lines
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        self._record(value, labels)
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 块的耗时（秒）"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def _increments(self, value, labels):
+        labels = self._labels(labels)
+        # 分桶是累计的：落入某个桶的观测值同时计入所有更大的桶
+        increments = [
+            (f'{self.name}_bucket' + _format_labels(labels + [('le', _format_value(bound))]), 1)
+            for bound in self.buckets if value <= bound
+        ]
+        increments.append((f'{self.name}_bucket' + _format_labels(labels + [('le', '+Inf')]), 1))
+        increments.append((f'{self.name}_sum' + _format_labels(labels), value))
+        increments.append((f'{self.name}_count' + _format_labels(labels), 1))
+        return increments
+
+    def expose(self, series):
+        lines = self.header()
+        count_prefix = f'{self.name}_count'
+        label_sets = sorted(
+            field[len(count_prefix):] for field in series
+            if field == count_prefix or field.startswith(count_prefix + '{')
+        )
+
+        for label_text in label_sets:
+            inner = label_text[1:-1]
+            for bound in [_format_value(b) for b in self.buckets] + ['+Inf']:
+                le = f'le="{bound}"'
+                field = f'{self.name}_bucket{{{inner + "," if inner else ""}{le}}}'
+                lines.append(f'{field} {_format_value(series.get(field, 0))}')
+            lines.append(f'{self.name}_sum{label_text} {_format_value(series[self.name + "_sum" + label_text])}')
+            lines.append(f'{count_prefix}{label_text} {_format_value(series[count_prefix + label_text])}')
+        return lines
+
+_metrics = []
+_collectors = []
+
+def register_collector(func):
+    """注册在抓取时计算的指标（如队列长度、各状态文档数）
+
+    func 返回 (名称, 类型, 说明, [(标签字典, 值), ...]) 列表。
+    """
+    _collectors.append(func)
+    return func
+
+def _expose_collected(name, metric_type, documentation, samples):
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}')
+    return lines
+
+def render_metrics():
+    """生成 Prometheus 文本格式的全部指标"""
+    try:
+        raw = get_redis().hgetall(SERIES_KEY)
+        series = {field.decode(): float(value) for field, value in raw.items()}
+    except redis.RedisError as e:
+        print(f"读取指标失败: {str(e)}")
+        series = {}
+
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.expose(series))
+    for collector in _collectors:
+        try:
+            collected = collector()
+        except Exception as e:
+            print(f"采集指标失败: {str(e)}")
+            continue
+        for name, metric_type, documentation, samples in collected:
+            lines.extend(_expose_collected(name, metric_type, documentation, samples))
+    return '\n'.join(lines) + '\n'
+
+def reset_metrics():
+    """清空累计的计数器与直方图"""
+    get_redis().delete(SERIES_KEY)
+
+http_request_duration = Histogram(
+    'http_request_duration_seconds', '按URL名称统计的请求耗时', ('view', 'method', 'status')
+)
+
+@register_collector
+def celery_queue_depth():
+    """Celery 消息队列中等待执行的任务数（Redis broker 的列表长度）"""
+    client = redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_connect_timeout=1, socket_timeout=1)
+    try:
+        pipe = client.pipeline(transaction=False)
+        for queue in settings.METRICS_CELERY_QUEUES:
+            pipe.llen(queue)
+        depths = pipe.execute()
+    finally:
+        client.close()
+
+    return [(
+        'celery_queue_length', 'gauge', 'Celery队列中等待执行的任务数',
+        [({'queue': queue}, depth) for queue, depth in zip(settings.METRICS_CELERY_QUEUES, depths)]
+    )]
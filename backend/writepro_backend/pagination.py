@@ -0,0 +1,105 @@
+import json
+import uuid
+import base64
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+def projection_fields(serializer_class, prefix=''):
+    """返回序列化器用到的模型字段名，配合 QuerySet.only() 只加载需要的列"""
+    model = serializer_class.Meta.model
+    fields = []
+    for name in serializer_class.Meta.fields:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # 属性或方法字段，依赖的列需由调用方补充
+            continue
+        if field.concrete:
+            fields.append(prefix + name)
+    return fields
+
+class KeysetPagination:
+    """按 (created_at, id) 倒序的游标分页
+
+    请求带 cursor 参数时启用（首页传空值 ?cursor=）。游标是上一页最后一条记录的
+    (created_at, id) 编码，翻页只按索引定位，耗时不随页数增加。默认不统计总数，
+    需要时传 ?count=1。
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def __init__(self, page_size=20):
+        self.page_size = page_size
+
+    def is_requested(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def encode_cursor(self, obj):
+        payload = json.dumps([obj.created_at.isoformat(), str(obj.id)])
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, token):
+        try:
+            created_at, object_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+            created_at = parse_datetime(created_at)
+            object_id = uuid.UUID(object_id)
+        except (TypeError, ValueError, UnicodeEncodeError):
+            raise NotFound('无效的游标')
+        if created_at is None:
+            raise NotFound('无效的游标')
+        return created_at, object_id
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def page_queryset(self, queryset, cursor, page_size):
+        """返回游标之后的一页（多取一条，用于判断是否还有下一页）
+
+        cursor 为 (created_at, id)，首页传 None。
+        """
+        if cursor is not None:
+            created_at, object_id = cursor
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=object_id)
+            )
+        return queryset.order_by('-created_at', '-id')[:page_size + 1]
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        self.count = queryset.count() if request.query_params.get('count') in ('1', 'true') else None
+
+        token = request.query_params.get(self.cursor_query_param)
+        cursor = self.decode_cursor(token) if token else None
+
+        page_size = self.get_page_size(request)
+        page = list(self.page_queryset(queryset, cursor, page_size))
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        response = {
+            'results': data,
+            'next_cursor': self.next_cursor,
+            'next': self.get_next_link(),
+        }
+        if self.count is not None:
+            response['count'] = self.count
+        return Response(response)
@@ -0,0 +1,218 @@
+import os
+import sys
+import hmac
+import time
+import uuid
+import random
+import hashlib
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import request_started
+from django.utils import timezone
+
+PROFILE_HEADER = 'X-Profile-Signature'
+
+# ASGI下同步视图在每个请求专属的线程中执行，request_started 也在该线程发送
+_request_thread = ContextVar('profiler_request_thread', default=None)
+
+def _record_request_thread(sender, **kwargs):
+    _request_thread.set(threading.get_ident())
+
+def sign_profile_request(secret, timestamp, method, path):
+    """计算采样请求签名：HMAC-SHA256(secret, "<timestamp>.<METHOD> <path>")"""
+    message = f'{timestamp}.{method.upper()} {path}'.encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def verify_profile_signature(request):
+    """校验 X-Profile-Signature: <timestamp>.<signature>，签名绑定请求方法与路径"""
+    secret = settings.PROFILER_SECRET
+    value = request.headers.get(PROFILE_HEADER)
+    if not secret or not value:
+        return False
+
+    timestamp, _, signature = value.partition('.')
+    try:
+        if abs(time.time() - int(timestamp)) > settings.PROFILER_SIGNATURE_TOLERANCE:
+            return False
+    except ValueError:
+        return False
+    return hmac.compare_digest(sign_profile_request(secret, timestamp, request.method, request.path), signature)
+
+def _path_prefixes():
+    return sorted({os.path.join(os.path.abspath(p), '') for p in sys.path if p}, key=len, reverse=True)
+
+def _frame_label(code, prefixes):
+    filename = code.co_filename
+    for prefix in prefixes:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+class StackSampler:
+    """定时读取指定线程的调用栈，按折叠格式（flame graph 的输入）累计采样次数
+
+    采样在独立线程中进行，被采样线程不需要任何插桩，开销只与采样间隔有关。
+    """
+
+    def __init__(self, threads, interval):
+        # threads: {线程ID: 标签}，标签作为折叠栈的根节点，区分不同线程
+        self.threads = threads
+        self.interval = interval
+        self.stacks = Counter()
+        self._labels = {}
+        self._prefixes = _path_prefixes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, label in self.threads.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[label + ';' + self._fold(frame)] += 1
+
+    def _fold(self, frame):
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = _frame_label(code, self._prefixes)
+            labels.append(label)
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+def _safe_name(name):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)[:80]
+
+def _prune_profiles(directory):
+    files = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith('.folded')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in files[:max(len(files) - settings.PROFILER_MAX_FILES, 0)]:
+        os.remove(entry.path)
+
+def save_profile(kind, name, elapsed, stacks):
+    """把折叠栈写入采样目录，文件名包含类型、视图/任务名与耗时，返回文件名"""
+    directory = settings.PROFILER_OUTPUT_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    filename = (
+        f"{timezone.now():%Y%m%d-%H%M%S}-{kind}-{_safe_name(name)}-"
+        f"{elapsed * 1000:.0f}ms-{uuid.uuid4().hex[:6]}.folded"
+    )
+    with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write(f'{stack} {count}\n')
+
+    _prune_profiles(directory)
+    return filename
+
+def _sampled(rate):
+    return rate > 0 and random.random() < rate
+
+class ProfilingMiddleware:
+    """按需对单个请求做栈采样
+
+    请求带有效的 X-Profile-Signature（持有 PROFILER_SECRET 的管理员生成）时必定采样，
+    否则按 PROFILER_SAMPLE_RATE 随机采样。未开启时每个请求只有一次布尔判断。
+    采样结果的文件名在 X-Profile-Id 响应头中返回。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = bool(settings.PROFILER_SECRET) or settings.PROFILER_SAMPLE_RATE > 0
+        if self.enabled:
+            request_started.connect(_record_request_thread, dispatch_uid='profiler_request_thread')
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _should_profile(self, request):
+        return verify_profile_signature(request) or _sampled(settings.PROFILER_SAMPLE_RATE)
+
+    def _start(self, threads):
+        return StackSampler(threads, settings.PROFILER_INTERVAL / 1000).start(), time.perf_counter()
+
+    def _finish(self, request, response, sampler, started):
+        elapsed = time.perf_counter() - started
+        stacks = sampler.stop()
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match is not None else 'unresolved'
+        try:
+            response['X-Profile-Id'] = save_profile('request', name, elapsed, stacks)
+        except OSError as e:
+            print(f"保存采样结果失败: {str(e)}")
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.enabled or not self._should_profile(request):
+            return self.get_response(request)
+
+        sampler, started = self._start({threading.get_ident(): 'request'})
+        try:
+            response = self.get_response(request)
+        except Exception:
+            sampler.stop()
+            raise
+        return self._finish(request, response, sampler, started)
+
+    async def __acall__(self, request):
+        if not self.enabled or not self._should_profile(request):
+            return await self.get_response(request)
+
+        # 异步视图在事件循环线程执行，同步视图在请求专属线程执行，两者都采样
+        threads = {threading.get_ident(): 'event-loop'}
+        request_thread = _request_thread.get()
+        if request_thread is not None and request_thread not in threads:
+            threads[request_thread] = 'request'
+        sampler, started = self._start(threads)
+        try:
+            response = await self.get_response(request)
+        except Exception:
+            sampler.stop()
+            raise
+        return self._finish(request, response, sampler, started)
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    if _sampled(settings.PROFILER_TASK_SAMPLE_RATE):
+        sampler = StackSampler({threading.get_ident(): 'task'}, settings.PROFILER_INTERVAL / 1000)
+        task.request.profiler = (sampler.start(), time.perf_counter())
+
+def _task_postrun(task_id=None, task=None, **kwargs):
+    state = getattr(task.request, 'profiler', None)
+    if state is None:
+        return
+    task.request.profiler = None
+    sampler, started = state
+    elapsed = time.perf_counter() - started
+    try:
+        save_profile('task', task.name, elapsed, sampler.stop())
+    except OSError as e:
+        print(f"保存采样结果失败: {str(e)}")
+
+def connect_celery_signals():
+    """按 PROFILER_TASK_SAMPLE_RATE 对Celery任务采样；比例为0时每个任务只有一次数值比较"""
+    from celery.signals import task_postrun, task_prerun
+
+    task_prerun.connect(_task_prerun, weak=False)
+    task_postrun.connect(_task_postrun, weak=False)
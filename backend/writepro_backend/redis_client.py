@@ -0,0 +1,16 @@
+import os
+import redis
+from django.conf import settings
+
+_redis = None
+_redis_pid = None
+
+def get_redis():
+    """获取当前进程复用的Redis连接（fork 出的子进程重新创建）"""
+    global _redis, _redis_pid
+
+    if _redis is None or _redis_pid != os.getpid():
+        # 指标写入与事件发布都在请求和任务中同步进行，Redis不可用时快速失败
+        _redis = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+        _redis_pid = os.getpid()
+    return _redis
@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'rest_framework.authtoken',
     'corsheaders',
     'accounts',
     'documents',
@@ -30,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'writepro_backend.profiler.ProfilingMiddleware',
+    'writepro_backend.instrumentation.QueryTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -60,6 +63,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'writepro_backend.wsgi.application'
+ASGI_APPLICATION = 'writepro_backend.asgi.application'
 
 # Database
 DATABASES = {
@@ -121,24 +125,133 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ['Server-Timing']
 
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
 
 # File upload settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(2.5 * 1024 * 1024)  # 超过2.5MB的上传写入临时文件，不占用进程内存
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
+UPLOAD_CHUNK_MAX_SIZE = config('UPLOAD_CHUNK_MAX_SIZE', default=5 * 1024 * 1024, cast=int)  # 分片上传单片上限
+UPLOAD_CHUNK_LEASE = config('UPLOAD_CHUNK_LEASE', default=10 * 60, cast=int)  # 单个分片写入的最长时间（秒），超时后其他请求可重新上传该分片
+UPLOAD_SESSION_TTL = config('UPLOAD_SESSION_TTL', default=24 * 60 * 60, cast=int)  # 分片上传会话无新分片时的保留时间（秒）
+
+# File download settings
+# 设置后下载由nginx通过 X-Accel-Redirect 完成，例如 '/protected-media/'（对应 MEDIA_ROOT 的 internal location）
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = config('DOWNLOAD_ACCEL_REDIRECT_PREFIX', default='')
 
 # AIGC Service settings
-AIGC_SERVICE_URL = 'http://85.208.9.40:5001'
+AIGC_SERVICE_URL = config('AIGC_SERVICE_URL', default='http://85.208.9.40:5001')  # 压测时可指向 run_aigc_simulator
+AIGC_CONNECT_TIMEOUT = config('AIGC_CONNECT_TIMEOUT', default=5, cast=float)  # 秒
+AIGC_READ_TIMEOUT = config('AIGC_READ_TIMEOUT', default=30, cast=float)  # 提交与下载的读超时
+AIGC_STATUS_TIMEOUT = config('AIGC_STATUS_TIMEOUT', default=10, cast=float)  # 状态查询的读超时
+AIGC_POOL_SIZE = config('AIGC_POOL_SIZE', default=10, cast=int)  # 每个进程的长连接数
+AIGC_MAX_RETRIES = config('AIGC_MAX_RETRIES', default=3, cast=int)  # 幂等请求的重试次数
+AIGC_RETRY_BACKOFF = config('AIGC_RETRY_BACKOFF', default=0.5, cast=float)  # 退避基数（秒）
+AIGC_GZIP_REQUESTS = config('AIGC_GZIP_REQUESTS', default=False, cast=bool)  # 服务端支持时压缩大请求体
+AIGC_GZIP_MIN_BYTES = config('AIGC_GZIP_MIN_BYTES', default=64 * 1024, cast=int)
+AIGC_SEGMENT_MAX_CHARS = config('AIGC_SEGMENT_MAX_CHARS', default=5000, cast=int)  # 单个分段最大字符数
+AIGC_SEGMENT_CONCURRENCY = config('AIGC_SEGMENT_CONCURRENCY', default=4, cast=int)  # 每个文档同时处理的分段数
+AIGC_SEGMENT_MAX_RETRIES = config('AIGC_SEGMENT_MAX_RETRIES', default=2, cast=int)  # 单个分段失败后的重试次数
+AIGC_STATUS_CACHE_TTL = config('AIGC_STATUS_CACHE_TTL', default=5, cast=int)  # document_status 查询到的远程状态缓存秒数
+AIGC_POLL_INTERVAL = config('AIGC_POLL_INTERVAL', default=10, cast=int)  # 新任务的轮询间隔（秒）
+AIGC_POLL_MAX_INTERVAL = config('AIGC_POLL_MAX_INTERVAL', default=60, cast=int)  # 长任务的最大轮询间隔（秒）
+AIGC_POLL_AGE_FACTOR = config('AIGC_POLL_AGE_FACTOR', default=0.1, cast=float)  # 轮询间隔随任务时长增长的比例
+AIGC_POLL_TICK = config('AIGC_POLL_TICK', default=5, cast=int)  # 集中轮询任务的执行周期（秒）
+AIGC_POLL_BATCH_SIZE = config('AIGC_POLL_BATCH_SIZE', default=500, cast=int)  # 每轮最多检查的任务数
+AIGC_POLL_CONCURRENCY = config('AIGC_POLL_CONCURRENCY', default=16, cast=int)  # 逐个查询时的并发数
+AIGC_BATCH_STATUS_PATH = config('AIGC_BATCH_STATUS_PATH', default='')  # 服务提供批量状态接口时配置，如 '/api/rewrite/status/batch'
+AIGC_CALLBACK_URL = config('AIGC_CALLBACK_URL', default='')  # 完成回调地址，如 'https://example.com/api/v1/documents/aigc/callback/'；为空时只靠轮询
+AIGC_WEBHOOK_SECRET = config('AIGC_WEBHOOK_SECRET', default='')  # 回调签名密钥
+AIGC_WEBHOOK_TOLERANCE = config('AIGC_WEBHOOK_TOLERANCE', default=300, cast=int)  # 回调时间戳允许的偏差（秒）
+AIGC_TASK_TIMEOUT = config('AIGC_TASK_TIMEOUT', default=600, cast=int)  # 单个AIGC任务最长等待秒数
+
+# AIGC adaptive concurrency limiter & circuit breaker
+AIGC_LIMIT_INITIAL = config('AIGC_LIMIT_INITIAL', default=8, cast=int)  # 所有进程共享的初始提交并发上限
+AIGC_LIMIT_MIN = config('AIGC_LIMIT_MIN', default=1, cast=int)
+AIGC_LIMIT_MAX = config('AIGC_LIMIT_MAX', default=32, cast=int)
+AIGC_LIMIT_DECREASE_FACTOR = config('AIGC_LIMIT_DECREASE_FACTOR', default=0.5, cast=float)  # 出错或变慢时的乘性减少系数
+AIGC_LATENCY_TARGET = config('AIGC_LATENCY_TARGET', default=5, cast=float)  # 提交请求的目标耗时（秒），超过即视为拥塞
+AIGC_BREAKER_FAILURE_THRESHOLD = config('AIGC_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)  # 窗口内不可用错误次数达到该值时熔断
+AIGC_BREAKER_WINDOW = config('AIGC_BREAKER_WINDOW', default=60, cast=int)  # 错误统计窗口（秒）
+AIGC_BREAKER_COOLDOWN = config('AIGC_BREAKER_COOLDOWN', default=30, cast=int)  # 熔断后的冷却时间（秒）
+AIGC_THROTTLE_DEFAULT_DELAY = config('AIGC_THROTTLE_DEFAULT_DELAY', default=2, cast=float)  # 限流响应未带 Retry-After 时暂停提交的秒数
+AIGC_THROTTLE_MAX_DELAY = config('AIGC_THROTTLE_MAX_DELAY', default=60, cast=float)  # Retry-After 的上限（秒）
+
+# AIGC rewrite cache settings
+AIGC_REWRITE_CACHE_ENABLED = config('AIGC_REWRITE_CACHE_ENABLED', default=True, cast=bool)
+AIGC_REWRITE_CACHE_MAX_AGE_DAYS = config('AIGC_REWRITE_CACHE_MAX_AGE_DAYS', default=30, cast=int)  # 超过该天数未命中即淘汰
+AIGC_REWRITE_CACHE_MAX_BYTES = config('AIGC_REWRITE_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)  # 缓存总容量上限
+
+# PDF text extraction settings
+PDF_EXTRACT_WORKERS = config('PDF_EXTRACT_WORKERS', default=os.cpu_count() or 1, cast=int)
+PDF_PARALLEL_MIN_PAGES = config('PDF_PARALLEL_MIN_PAGES', default=50, cast=int)  # 少于该页数时串行提取
+PDF_PAGES_PER_TASK = config('PDF_PAGES_PER_TASK', default=20, cast=int)
+PDF_EXTRACT_START_METHOD = config('PDF_EXTRACT_START_METHOD', default='forkserver')  # 提取进程池的启动方式（forkserver 或 spawn），子进程只导入 documents.pdf_pages
+PDF_EXTRACT_QUEUE = config('PDF_EXTRACT_QUEUE', default='extraction')  # 文本提取任务的队列，由 --pool=threads 的 worker 消费才能并行提取PDF
+
+# Redis（Celery消息队列与共享缓存）
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
+
+# Server-Sent Events
+SSE_HEARTBEAT_INTERVAL = config('SSE_HEARTBEAT_INTERVAL', default=15, cast=int)  # 心跳间隔（秒）
+SSE_MAX_HEARTBEATS = config('SSE_MAX_HEARTBEATS', default=8, cast=int)  # 发送该数量的心跳后结束事件流，由客户端自动重连
+SSE_RETRY_MS = config('SSE_RETRY_MS', default=3000, cast=int)  # 建议客户端断开后的重连间隔（毫秒）
+
+# 请求与任务的SQL/耗时统计
+INSTRUMENTATION_ENABLED = config('INSTRUMENTATION_ENABLED', default=True, cast=bool)
+INSTRUMENTATION_SLOW_MS = config('INSTRUMENTATION_SLOW_MS', default=1000, cast=int)  # 超过该耗时（毫秒）的请求或任务打印统计
+
+# 栈采样（按需分析线上慢请求/任务，结果为折叠栈格式）
+PROFILER_SECRET = config('PROFILER_SECRET', default='')  # 请求头 X-Profile-Signature 的签名密钥，为空时不接受签名触发
+PROFILER_SIGNATURE_TOLERANCE = config('PROFILER_SIGNATURE_TOLERANCE', default=300, cast=int)  # 签名时间戳允许的偏差（秒）
+PROFILER_SAMPLE_RATE = config('PROFILER_SAMPLE_RATE', default=0.0, cast=float)  # 随机采样的请求比例，0为关闭
+PROFILER_TASK_SAMPLE_RATE = config('PROFILER_TASK_SAMPLE_RATE', default=0.0, cast=float)  # 随机采样的Celery任务比例，0为关闭
+PROFILER_INTERVAL = config('PROFILER_INTERVAL', default=5, cast=int)  # 采样间隔（毫秒）
+PROFILER_OUTPUT_DIR = config('PROFILER_OUTPUT_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILER_MAX_FILES = config('PROFILER_MAX_FILES', default=200, cast=int)  # 保留的采样文件数，超出时删除最旧的
+
+# Prometheus 指标（各进程写入Redis汇总，由 /metrics 输出）
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # 抓取需带 Authorization: Bearer <token>
+METRICS_ALLOW_ANONYMOUS = config('METRICS_ALLOW_ANONYMOUS', default=False, cast=bool)  # 未设置令牌时允许匿名抓取，仅用于只在内网暴露的部署
+METRICS_CELERY_QUEUES = config('METRICS_CELERY_QUEUES', default='celery,extraction', cast=Csv())  # 统计长度的Celery队列
+
+# Cache（跨进程共享，用于任务锁等）
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+}
 
 # Celery settings (for async tasks)
-CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ROUTES = {
+    # prefork 子进程无法创建PDF提取进程池，文本提取交给单独的线程池 worker
+    'documents.utils.extract_document_text': {'queue': PDF_EXTRACT_QUEUE},
+}
+CELERY_BEAT_SCHEDULE = {
+    'poll-aigc-tasks': {
+        'task': 'documents.utils.poll_aigc_tasks',
+        'schedule': AIGC_POLL_TICK,
+        'options': {'expires': AIGC_POLL_TICK},
+    },
+    'prune-rewrite-cache': {
+        'task': 'documents.utils.prune_rewrite_cache',
+        'schedule': 60 * 60,
+    },
+    'cleanup-upload-sessions': {
+        'task': 'documents.utils.cleanup_upload_sessions',
+        'schedule': 60 * 60,
+    },
+}
 
 # Email settings (for verification codes)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development
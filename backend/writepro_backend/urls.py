@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from . import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -9,6 +10,10 @@ urlpatterns = [
     path('api/v1/documents/', include('documents.urls')),
     path('api/v1/orders/', include('orders.urls')),
     path('api/v1/payments/', include('payments.urls')),
+    path('api/v1/timing/', views.timing_report_view, name='timing_report'),
+    path('api/v1/profiles/', views.profile_list, name='profile_list'),
+    path('api/v1/profiles/<str:name>/', views.profile_download, name='profile_download'),
+    path('metrics', views.metrics, name='metrics'),
 ]
 
 if settings.DEBUG:
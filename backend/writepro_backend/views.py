@@ -0,0 +1,61 @@
+import os
+import hmac
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.http import content_disposition_header
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .instrumentation import timing_report
+from .metrics import render_metrics
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def timing_report_view(request):
+    """当前进程按视图/任务汇总的SQL次数与耗时；DELETE 清空统计"""
+    if request.method == 'DELETE':
+        timing_report.reset()
+        return Response({'message': '统计已清空'})
+    return Response({'results': timing_report.snapshot()})
+
+def metrics(request):
+    """Prometheus 文本格式的指标；需带 METRICS_TOKEN 的 Bearer 令牌，未配置令牌时默认拒绝抓取"""
+    if settings.METRICS_TOKEN:
+        auth = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth, f'Bearer {settings.METRICS_TOKEN}'):
+            return HttpResponse(status=401)
+    elif not settings.METRICS_ALLOW_ANONYMOUS:
+        return HttpResponse(status=403)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _profile_files():
+    if not os.path.isdir(settings.PROFILER_OUTPUT_DIR):
+        return []
+    return sorted(
+        (entry for entry in os.scandir(settings.PROFILER_OUTPUT_DIR) if entry.name.endswith('.folded')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True
+    )
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_list(request):
+    """已保存的栈采样结果，按时间倒序"""
+    return Response({'results': [
+        {'name': entry.name, 'size': entry.stat().st_size, 'created_at': entry.stat().st_mtime}
+        for entry in _profile_files()
+    ]})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_download(request, name):
+    """下载折叠栈文件，可直接作为 flamegraph.pl / speedscope 的输入"""
+    if os.path.basename(name) != name or not name.endswith('.folded'):
+        raise Http404
+    path = os.path.join(settings.PROFILER_OUTPUT_DIR, name)
+    if not os.path.isfile(path):
+        raise Http404
+
+    with open(path, 'rb') as f:
+        response = HttpResponse(f.read(), content_type='text/plain; charset=utf-8')
+    response['Content-Disposition'] = content_disposition_header(True, name)
+    return response